@@ -0,0 +1,54 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+ASYNC_ROUTES = {
+    "recipes-list",
+    "recipes-detail",
+    "recipes-similar",
+    "recipes-cook",
+    "tags-list",
+    "tags-detail",
+    "ingredients-list",
+    "ingredients-detail",
+}
+
+
+def async_view(view):
+    """Асинхронная обертка синхронного представления для ASGI.
+
+    В Django 3.2 нет асинхронного ORM, а синхронные представления
+    под ASGI выполняются по очереди в одном общем потоке. Обертка
+    выполняет представление вместе с рендерингом ответа в пуле потоков,
+    поэтому медленные запросы к базе не блокируют остальные.
+    У каждого потока пула свое соединение с базой.
+    """
+
+    def run(request, *args, **kwargs):
+        close_old_connections()
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, "render") and callable(response.render):
+                response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    run = sync_to_async(run, thread_sensitive=False)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run(request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_patterns(patterns, names=ASYNC_ROUTES):
+    """Заменяет представления маршрутов с именами names
+    асинхронными обертками.
+    """
+    for pattern in patterns:
+        if pattern.name in names:
+            pattern.callback = async_view(pattern.callback)
+    return patterns
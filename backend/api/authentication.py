@@ -0,0 +1,90 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from api.replicas import primary_reads
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+TOKEN_TIMEOUT = 60 * 60 * 24
+LOCAL_TOKEN_TIMEOUT = 30
+LOCAL_TOKENS_SIZE = 10000
+
+
+def token_key(key):
+    return f"auth_token:{key}"
+
+
+class LocalTokenCache:
+    """LRU-кэш пользователей по токену в памяти процесса.
+    Записи живут LOCAL_TOKEN_TIMEOUT секунд: столько другие процессы
+    могут видеть удаленный токен или деактивированного пользователя.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            user, expires = self._users.get(key, (None, 0))
+            if expires < time.monotonic():
+                self._users.pop(key, None)
+                return None
+            self._users.move_to_end(key)
+            return user
+
+    def set(self, key, user):
+        with self._lock:
+            self._users[key] = (user, time.monotonic() + self.timeout)
+            self._users.move_to_end(key)
+            while len(self._users) > self.size:
+                self._users.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._users.pop(key, None)
+
+
+local_tokens = LocalTokenCache(LOCAL_TOKENS_SIZE, LOCAL_TOKEN_TIMEOUT)
+
+
+def invalidate_tokens(keys):
+    """Убирает токены из локального и общего кэша
+    после фиксации транзакции.
+    """
+    keys = list(keys)
+
+    def invalidate():
+        for key in keys:
+            local_tokens.delete(key)
+        cache.delete_many([token_key(key) for key in keys])
+
+    transaction.on_commit(invalidate)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену без запроса к базе,
+    если пользователь токена уже есть в кэше.
+    """
+
+    def authenticate_credentials(self, key):
+        user = local_tokens.get(key)
+        if user is None:
+            user = cache.get(token_key(key))
+            if user is None:
+                # Реплика может еще не знать о новом токене,
+                # а устаревший пользователь остался бы в кэше.
+                with primary_reads():
+                    user, token = super().authenticate_credentials(key)
+                cache.set(token_key(key), user, TOKEN_TIMEOUT)
+            local_tokens.set(key, user)
+        # Копия, чтобы изменения пользователя во время запроса
+        # не попадали в объект, общий для потоков процесса.
+        user = copy.copy(user)
+        return user, Token(key=key, user=user)
@@ -1,5 +1,7 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Favourite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.search import search_recipes
 
 
 class IngredientFilter(FilterSet):
@@ -15,6 +17,7 @@ class RecipeFilter(FilterSet):
         queryset=Tag.objects.all(),
         field_name='tags__slug',
         to_field_name='slug',
+        method='get_tags',
     )
     is_favorited = filters.BooleanFilter(
         method='get_is_favorited'
@@ -22,17 +25,32 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart', 'search'
+        )
+
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.with_any_tag(value)
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(Exists(Favourite.objects.filter(
+                user=self.request.user, recipe=OuterRef("pk")
+            )))
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(carts__user=self.request.user)
+            return queryset.filter(Exists(ShoppingCart.objects.filter(
+                user=self.request.user, recipe=OuterRef("pk")
+            )))
         return queryset
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
@@ -0,0 +1,207 @@
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from urllib.error import HTTPError
+from urllib.parse import quote, urlencode
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from recipes.generator import DISHES, PRODUCTS
+from recipes.models import Recipe, Tag
+from rest_framework.authtoken.models import Token
+from users.models import UserFoodgram
+
+
+def endpoints():
+    """Адреса основных эндпоинтов с параметрами из данных в базе."""
+    tag = Tag.objects.annotate(
+        recipes_count=Count("tags")
+    ).order_by("-recipes_count").first()
+    author = Recipe.objects.values("author").annotate(
+        recipes_count=Count("id")
+    ).order_by("-recipes_count").first()
+    recipe = Recipe.objects.order_by("-pub_date").first()
+    if recipe is None:
+        raise CommandError("Нет рецептов, используйте generate_data.")
+    ingredients = urlencode(
+        {"ingredients": recipe.ingredients.values_list("id", flat=True)},
+        doseq=True
+    )
+    return {
+        "recipes": "/api/recipes/",
+        "recipes_tags": f"/api/recipes/?tags={quote(tag.slug)}",
+        "recipes_author": f"/api/recipes/?author={author['author']}",
+        "recipes_favorited": "/api/recipes/?is_favorited=1",
+        "recipes_in_cart": "/api/recipes/?is_in_shopping_cart=1",
+        "recipes_search": f"/api/recipes/?search={quote(DISHES[0])}",
+        "recipe_detail": f"/api/recipes/{recipe.id}/",
+        "recipe_similar": f"/api/recipes/{recipe.id}/similar/",
+        "recipes_cook": f"/api/recipes/cook/?{ingredients}",
+        "recipes_feed": "/api/recipes/feed/",
+        "subscriptions": "/api/users/subscriptions/",
+        "shopping_list": "/api/recipes/download_shopping_cart/",
+        "ingredients": f"/api/ingredients/?name={quote(PRODUCTS[0][:3])}",
+        "tags": "/api/tags/",
+    }
+
+
+def percentile(values, percent):
+    """Процентиль по ближайшему рангу."""
+    values = sorted(values)
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+class ClientDriver:
+    """Запросы через тестовый клиент Django в этом процессе,
+    с подсчетом SQL-запросов.
+    """
+
+    def __init__(self, token):
+        self.client = Client(HTTP_AUTHORIZATION=f"Token {token}")
+
+    def get(self, path):
+        with ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connection))
+                for connection in connections.all()
+            ]
+            response = self.client.get(path)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        return response.status_code, sum(map(len, captured))
+
+
+class ServerDriver:
+    """Запросы к запущенному серверу, число SQL-запросов неизвестно."""
+
+    def __init__(self, token, url):
+        self.url = url.rstrip("/")
+        self.headers = {"Authorization": f"Token {token}"}
+
+    def get(self, path):
+        request = Request(self.url + path, headers=self.headers)
+        try:
+            with urlopen(request) as response:
+                response.read()
+                return response.status, None
+        except HTTPError as error:
+            return error.code, None
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест основных эндпоинтов API: задержки p50/p95/p99, "
+        "SQL-запросы на запрос и пропускная способность."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=100,
+            help="число запросов к каждому эндпоинту"
+        )
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument(
+            "--url",
+            help="адрес запущенного сервера, по умолчанию тестовый клиент"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=1,
+            help="число одновременных запросов, только с --url"
+        )
+        parser.add_argument(
+            "--user",
+            help="имя пользователя, по умолчанию самый активный покупатель"
+        )
+        parser.add_argument(
+            "--endpoint", action="append",
+            help="проверить только эти эндпоинты"
+        )
+        parser.add_argument("--output", help="сохранить результаты в JSON")
+        parser.add_argument(
+            "--compare", help="JSON с результатами прошлого запуска"
+        )
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            user = UserFoodgram.objects.get(username=options["user"])
+        else:
+            user = UserFoodgram.objects.annotate(
+                cart_count=Count("carts")
+            ).order_by("-cart_count").first()
+        if user is None:
+            raise CommandError("Нет пользователей, используйте generate_data.")
+        if options["concurrency"] > 1 and not options["url"]:
+            raise CommandError("--concurrency работает только с --url.")
+        token, _ = Token.objects.get_or_create(user=user)
+        if options["url"]:
+            driver = ServerDriver(token.key, options["url"])
+        else:
+            driver = ClientDriver(token.key)
+        paths = endpoints()
+        if options["endpoint"]:
+            paths = {name: paths[name] for name in options["endpoint"]}
+        results = {
+            name: self.run(driver, path, options)
+            for name, path in paths.items()
+        }
+        previous = {}
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                previous = json.load(file)
+        self.report(results, previous)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(results, file, indent=2)
+
+    def run(self, driver, path, options):
+        for _ in range(options["warmup"]):
+            driver.get(path)
+
+        def timed(_):
+            start = time.perf_counter()
+            status, count = driver.get(path)
+            return time.perf_counter() - start, status, count
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            samples = list(pool.map(timed, range(options["requests"])))
+        elapsed = time.perf_counter() - start
+        durations = [duration for duration, _, _ in samples]
+        queries = [count for _, _, count in samples]
+        return {
+            "path": path,
+            "requests": len(samples),
+            "concurrency": options["concurrency"],
+            "errors": sum(status >= 400 for _, status, _ in samples),
+            "p50": percentile(durations, 50) * 1000,
+            "p95": percentile(durations, 95) * 1000,
+            "p99": percentile(durations, 99) * 1000,
+            "rps": len(samples) / elapsed,
+            "queries": (
+                None if queries[0] is None else sum(queries) / len(queries)
+            ),
+        }
+
+    def report(self, results, previous):
+        self.stdout.write(
+            f"{'endpoint':20} {'p50':>8} {'p95':>8} {'p99':>8} "
+            f"{'rps':>8} {'queries':>8} {'errors':>6}"
+        )
+        for name, result in results.items():
+            queries = result["queries"]
+            line = (
+                f"{name:20} {result['p50']:8.1f} {result['p95']:8.1f} "
+                f"{result['p99']:8.1f} {result['rps']:8.1f} "
+                f"{'-' if queries is None else f'{queries:.1f}':>8} "
+                f"{result['errors']:6}"
+            )
+            if name in previous:
+                change = result["p95"] / previous[name]["p95"] - 1
+                line += f"  p95 {change:+.0%}"
+            self.stdout.write(line)
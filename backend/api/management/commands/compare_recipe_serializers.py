@@ -0,0 +1,118 @@
+import time
+
+from api.renderers import ORJSONRenderer
+from api.serializers import RecipeGetSerializer, RecipeReadSerializer
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from recipes.models import Recipe
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.models import UserFoodgram
+
+
+def make_request(user):
+    request = Request(APIRequestFactory().get("/api/recipes/"))
+    request.user = user
+    return request
+
+
+def render(serializer_class, renderer, instance, request, many=False):
+    serializer = serializer_class(
+        instance, many=many, context={"request": request}
+    )
+    return renderer.render(serializer.data)
+
+
+def cpu_time(function, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        function()
+    return (time.process_time() - start) / repeat * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверяет, что RecipeReadSerializer с ORJSONRenderer отдают "
+        "те же байты, что RecipeGetSerializer с JSONRenderer, "
+        "и сравнивает затраты процессора на страницу рецептов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit", type=int, default=0,
+            help="проверить только столько последних рецептов"
+        )
+        parser.add_argument(
+            "--page-size", type=int, default=6,
+            help="размер страницы для замера"
+        )
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.with_related().order_by("-pub_date", "-id")
+        if options["limit"]:
+            recipes = recipes[:options["limit"]]
+        recipes = list(recipes)
+        if not recipes:
+            raise CommandError("Нет рецептов, используйте generate_data.")
+        user = UserFoodgram.objects.annotate(
+            favorites_count=Count("favorites")
+        ).order_by("-favorites_count").first()
+        requests = [make_request(AnonymousUser()), make_request(user)]
+        self.check_equal(recipes, requests)
+        self.stdout.write(self.style.SUCCESS(
+            f"Ответы совпадают: рецептов {len(recipes)}."
+        ))
+        self.benchmark(
+            recipes[:options["page_size"]], requests[1], options["repeat"]
+        )
+
+    def check_equal(self, recipes, requests):
+        old = (RecipeGetSerializer, JSONRenderer())
+        new = (RecipeReadSerializer, ORJSONRenderer())
+        for request in requests:
+            for recipe in recipes:
+                expected = render(*old, recipe, request)
+                actual = render(*new, recipe, request)
+                if expected != actual:
+                    raise CommandError(
+                        f"Рецепт {recipe.id} для {request.user}:\n"
+                        f"{expected.decode()}\n{actual.decode()}"
+                    )
+            expected = render(*old, recipes, request, many=True)
+            if expected != render(*new, recipes, request, many=True):
+                raise CommandError(f"Список рецептов для {request.user}.")
+
+    def benchmark(self, page, request, repeat):
+        results = {}
+        for serializer_class in (RecipeGetSerializer, RecipeReadSerializer):
+            data = serializer_class(
+                page, many=True, context={"request": request}
+            ).data
+            results[serializer_class.__name__] = cpu_time(
+                lambda: serializer_class(
+                    page, many=True, context={"request": request}
+                ).data,
+                repeat,
+            )
+            for renderer in (JSONRenderer(), ORJSONRenderer()):
+                results[
+                    f"{serializer_class.__name__} + "
+                    f"{type(renderer).__name__}"
+                ] = cpu_time(lambda: renderer.render(data), repeat)
+        for name, duration in results.items():
+            self.stdout.write(f"{name:45} {duration:8.3f} ms")
+        before = (
+            results["RecipeGetSerializer"]
+            + results["RecipeGetSerializer + JSONRenderer"]
+        )
+        after = (
+            results["RecipeReadSerializer"]
+            + results["RecipeReadSerializer + ORJSONRenderer"]
+        )
+        self.stdout.write(
+            f"Страница из {len(page)} рецептов: {before:.3f} ms -> "
+            f"{after:.3f} ms, в {before / after:.1f} раза быстрее"
+        )
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import random
+from collections import Counter
+from contextlib import ExitStack
+from time import perf_counter
+
+from api.replicas import is_pinned, pin_to_primary, reads_from
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger("api.requests")
+
+DUPLICATES_LOGGED = 5
+
+
+class QueryStats:
+    """Число, время и тексты SQL-запросов, выполненных за запрос."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0
+        self.statements = Counter()
+        self.marks = {}
+
+    def mark(self, name):
+        self.marks[name] = (perf_counter(), self.time)
+
+    def between(self, start, end):
+        """Время между отметками: полное и без SQL."""
+        elapsed = self.marks[end][0] - self.marks[start][0]
+        return elapsed, elapsed - (self.marks[end][1] - self.marks[start][1])
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        return [
+            (count, sql)
+            for sql, count in self.statements.most_common(DUPLICATES_LOGGED)
+            if count > 1
+        ]
+
+
+class RequestStatsMiddleware:
+    """Считает SQL-запросы и время обработки запроса,
+    отдает их в заголовке Server-Timing и пишет в журнал запросы,
+    которые вышли за бюджет.
+
+    view — время представления без SQL, включая сериализацию:
+    DRF сериализует данные внутри представления.
+    render — время рендеринга ответа без SQL.
+    Запросы, которые потоковый ответ делает при отдаче тела, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_STATS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        request.query_stats = stats
+        stats.mark("start")
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        stats.mark("end")
+        total = stats.between("start", "end")[0]
+        timings = {"sql": stats.time}
+        if "view" in stats.marks:
+            # Ответы DRF рендерятся после process_template_response,
+            # остальные ответы готовы сразу после представления.
+            rendered = "rendered" if "rendered" in stats.marks else "end"
+            timings["view"] = stats.between("view", rendered)[1]
+            if rendered == "rendered":
+                timings["render"] = stats.between("rendered", "end")[1]
+        timings["total"] = total
+        response["Server-Timing"] = ", ".join(
+            f"{name};dur={duration * 1000:.1f}"
+            + (f';desc="{stats.count} queries"' if name == "sql" else "")
+            for name, duration in timings.items()
+        )
+        if (
+            stats.count > settings.REQUEST_STATS_QUERY_BUDGET
+            or total * 1000 > settings.REQUEST_STATS_TIME_BUDGET
+        ):
+            logger.warning(
+                "%s %s: %d SQL, %.1f ms SQL, %.1f ms total%s",
+                request.method,
+                request.get_full_path(),
+                stats.count,
+                stats.time * 1000,
+                total * 1000,
+                "".join(
+                    f"\n  x{count}: {sql}" for count, sql in stats.duplicates()
+                ),
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_stats.mark("view")
+
+    def process_template_response(self, request, response):
+        request.query_stats.mark("rendered")
+        return response
+
+
+class ReplicaMiddleware:
+    """Направляет чтение безопасных запросов на случайную реплику
+    из DATABASE_REPLICAS. Изменяющие запросы и запросы клиента,
+    недавно что-то изменившего, работают с основной базой.
+
+    Под ASGI работает асинхронно и не переводит цепочку
+    в общий синхронный поток: реплика хранится в ContextVar,
+    который sync_to_async передает в потоки представлений.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if request.method not in SAFE_METHODS:
+            try:
+                return self.get_response(request)
+            finally:
+                pin_to_primary(request)
+        with reads_from(self.replica_for(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.method not in SAFE_METHODS:
+            try:
+                return await self.get_response(request)
+            finally:
+                await sync_to_async(
+                    pin_to_primary, thread_sensitive=False
+                )(request)
+        replica = await sync_to_async(
+            self.replica_for, thread_sensitive=False
+        )(request)
+        with reads_from(replica):
+            return await self.get_response(request)
+
+    def replica_for(self, request):
+        """Случайная реплика или None, если клиент привязан
+        к основной базе.
+        """
+        if is_pinned(request):
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
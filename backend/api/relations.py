@@ -0,0 +1,105 @@
+from uuid import uuid4
+
+from api.replicas import primary_reads
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from recipes.models import Favourite, ShoppingCart
+from users.models import Subscription
+
+RELATIONS_TIMEOUT = 60 * 60 * 24
+
+RELATIONS = {
+    "favorites": lambda user_id: Favourite.objects.filter(
+        user_id=user_id
+    ).values_list("recipe_id", flat=True),
+    "cart": lambda user_id: ShoppingCart.objects.filter(
+        user_id=user_id
+    ).values_list("recipe_id", flat=True),
+    "subscriptions": lambda user_id: Subscription.objects.filter(
+        user_id=user_id
+    ).values_list("author_id", flat=True),
+}
+
+
+def generation_key(user_id):
+    return f"relations:{user_id}:generation"
+
+
+def relations_key(user_id, generation, name):
+    return f"relations:{user_id}:{generation}:{name}"
+
+
+def get_generation(user_id):
+    """Поколение множеств пользователя. Отсутствующее в кэше
+    поколение создается заново, как версии в api.response_cache.
+    """
+    key = generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+
+class UserRelations:
+    """Множества id рецептов в избранном и в корзине пользователя
+    и id авторов, на которых он подписан.
+    Читаются из кэша, при промахе загружаются из базы.
+    """
+
+    def __init__(self, user):
+        self.user_id = user.id if user.is_authenticated else None
+        self._sets = {}
+
+    def _load(self):
+        if self.user_id is None:
+            self._sets = {name: frozenset() for name in RELATIONS}
+            return
+        generation = get_generation(self.user_id)
+        keys = {
+            relations_key(self.user_id, generation, name): name
+            for name in RELATIONS
+        }
+        cached = cache.get_many(keys)
+        missing = {}
+        for key, name in keys.items():
+            if key in cached:
+                self._sets[name] = cached[key]
+                continue
+            # Множество живет в кэше долго, а реплика может
+            # еще не знать о последних изменениях пользователя.
+            with primary_reads():
+                self._sets[name] = frozenset(RELATIONS[name](self.user_id))
+            missing[key] = self._sets[name]
+        if missing:
+            cache.set_many(missing, RELATIONS_TIMEOUT)
+
+    def __getattr__(self, name):
+        if name not in RELATIONS:
+            raise AttributeError(name)
+        if not self._sets:
+            self._load()
+        return self._sets[name]
+
+
+def get_user_relations(request):
+    """Связи текущего пользователя, загружаются один раз на запрос."""
+    if request is None:
+        return UserRelations(AnonymousUser())
+    relations = getattr(request, "user_relations", None)
+    if relations is None:
+        relations = UserRelations(request.user)
+        request.user_relations = relations
+    return relations
+
+
+def invalidate_user_relations(user_id):
+    """Меняет поколение множеств пользователя после фиксации
+    транзакции, при следующем чтении они загрузятся из базы.
+    Множество, прочитанное параллельным запросом до фиксации,
+    сохраняется под ключом старого поколения и больше не читается.
+    """
+    transaction.on_commit(
+        lambda: cache.set(generation_key(user_id), uuid4().hex, None)
+    )
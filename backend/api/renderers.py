@@ -0,0 +1,99 @@
+import csv
+import json
+
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSON-рендерер на orjson.
+    Вывод совпадает с JSONRenderer побайтно: типы, которых нет в orjson,
+    и даты кодируются энкодером DRF, U+2028 и U+2029 экранируются.
+    Отличаются только числа с плавающей точкой в экспоненциальной
+    записи (1e20 вместо 1e+20), в ответах API таких нет.
+    Ответы с отступами и данные, которые orjson не кодирует,
+    отдаются JSONRenderer.
+    """
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if not self.compact or self.ensure_ascii or self.get_indent(
+            accepted_media_type, renderer_context or {}
+        ) is not None:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=self.options
+            )
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        return ret.replace(
+            "\u2028".encode(), b"\\u2028"
+        ).replace("\u2029".encode(), b"\\u2029")
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+    Список отдается потоком через stream(),
+    render() используется только для ответов с ошибками.
+    """
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def stream(self, ingredients):
+        raise NotImplementedError
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = "text/plain"
+    format = "txt"
+
+    def stream(self, ingredients):
+        for name, amount, measurement_unit in ingredients:
+            yield f"{name.capitalize()} - {amount} {measurement_unit}\n"
+
+
+class Echo:
+    """Файлоподобный объект, который возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(("name", "amount", "measurement_unit"))
+        for ingredient in ingredients:
+            yield writer.writerow(ingredient)
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = "application/json"
+    format = "json"
+
+    def stream(self, ingredients):
+        separator = "["
+        for name, amount, measurement_unit in ingredients:
+            yield separator + json.dumps(
+                {
+                    "name": name,
+                    "amount": amount,
+                    "measurement_unit": measurement_unit,
+                },
+                ensure_ascii=False
+            )
+            separator = ","
+        yield "]" if separator == "," else "[]"
@@ -0,0 +1,79 @@
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Реплика, с которой читает текущий запрос, None - основная база.
+# ContextVar, а не threading.local: значение переходит в потоки,
+# где sync_to_async выполняет представления под ASGI.
+read_replica = ContextVar("read_replica", default=None)
+
+
+@contextmanager
+def reads_from(alias):
+    """Внутри блока чтение идет с заданной реплики или,
+    если alias равен None, с основной базы.
+    """
+    token = read_replica.set(alias)
+    try:
+        yield
+    finally:
+        read_replica.reset(token)
+
+
+def primary_reads():
+    """Чтение с основной базы, например, для заполнения кэшей,
+    куда не должны попасть отстающие данные реплики.
+    """
+    return reads_from(None)
+
+
+def pin_key(request):
+    """Ключ привязки клиента к основной базе по токену или сессии."""
+    credentials = request.META.get("HTTP_AUTHORIZATION") or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    digest = hashlib.md5(credentials.encode()).hexdigest()
+    return f"replicas:pinned:{digest}"
+
+
+def pin_to_primary(request):
+    """После записи клиент читает с основной базы
+    REPLICA_PIN_SECONDS секунд и видит свои изменения.
+    """
+    key = pin_key(request)
+    if key:
+        cache.set(key, True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(request):
+    key = pin_key(request)
+    return key is not None and cache.get(key) is not None
+
+
+class ReplicaRouter:
+    """Запись в основную базу, чтение с реплики, выбранной
+    для запроса в ReplicaMiddleware. Вне запросов, в транзакциях
+    основной базы и в блоках primary_reads() чтение идет с основной базы.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_replica.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
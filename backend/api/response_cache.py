@@ -0,0 +1,122 @@
+import hashlib
+import time
+from uuid import uuid4
+
+from api.replicas import primary_reads
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+RESPONSE_TIMEOUT = 60 * 60 * 24
+
+# Версии, от которых зависят ответы о рецептах:
+# recipes - любой рецепт, recipe:<id> - один рецепт,
+# related - теги, ингредиенты и авторы, которые входят в ответы.
+RECIPES = "recipes"
+RELATED = "related"
+
+
+def recipe_version(recipe_id):
+    return f"recipe:{recipe_id}"
+
+
+def version_key(name):
+    return f"response_cache:version:{name}"
+
+
+def new_version():
+    return uuid4().hex, time.time()
+
+
+def get_versions(names):
+    """Версии по именам: (случайная строка, время изменения).
+    Отсутствующая в кэше версия создается заново, поэтому ответы,
+    сохраненные со старой версией, больше не используются.
+    """
+    keys = {version_key(name): name for name in names}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        cache.add(key, new_version(), None)
+        versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*names):
+    """Меняет версии после фиксации транзакции.
+    Старые ответы вытесняются из кэша по таймауту.
+    """
+    def bump():
+        cache.set_many(
+            {version_key(name): new_version() for name in names}, None
+        )
+
+    transaction.on_commit(bump)
+
+
+class AnonymousResponseCacheMixin:
+    """Кэширует ответы анонимным пользователям на GET-запросы.
+    Ключ строится из адреса с упорядоченными параметрами запроса,
+    формата ответа и версий данных. Ответы получают ETag
+    и Last-Modified и поддерживают условные запросы.
+    """
+
+    def cached(self, request, names, handler, *args, **kwargs):
+        # Кэшируется только JSON: страница BrowsableAPIRenderer
+        # содержит CSRF-токен конкретного клиента.
+        if (
+            request.user.is_authenticated
+            or request.method != "GET"
+            or not isinstance(request.accepted_renderer, JSONRenderer)
+        ):
+            return handler(request, *args, **kwargs)
+        versions = get_versions(names)
+        query = sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+        )
+        digest = hashlib.md5(repr((
+            request.build_absolute_uri(request.path),
+            query,
+            request.accepted_media_type,
+            [version for version, _ in versions],
+        )).encode()).hexdigest()
+        etag = quote_etag(digest)
+        last_modified = int(max(modified for _, modified in versions))
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = self.cached_response(
+                f"response_cache:{digest}", request, handler, *args, **kwargs
+            )
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def cached_response(self, key, request, handler, *args, **kwargs):
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        # Ответ живет в кэше до смены версии, поэтому читается
+        # с основной базы: реплика может отставать от изменения,
+        # которое эту версию создало.
+        with primary_reads():
+            response = handler(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        # Ответ рендерится здесь, а не в finalize_response,
+        # чтобы сохранить в кэш готовые байты.
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        response.render()
+        cache.set(
+            key, (response.content, response["Content-Type"]),
+            RESPONSE_TIMEOUT
+        )
+        return response
@@ -1,9 +1,13 @@
-from api.utils import create_ingredients
+from api.relations import get_user_relations
+from api.utils import create_ingredients, update_ingredients
 from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
-from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from recipes.feed import fan_out_recipe
+from recipes.images import is_current, process_recipe_image
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingListItem, Tag)
+from recipes.similar import refresh_similar_recipes
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 from users.models import Subscription, UserFoodgram
@@ -40,24 +44,83 @@ class UserGetSerializer(UserSerializer):
 
     def get_is_subscribed(self, obj):
         request = self.context.get("request")
-        return (
-            request.user.is_authenticated
-            and Subscription.objects.filter(
-                user=request.user, author=obj
-            ).exists())
+        return obj.id in get_user_relations(request).subscriptions
+
+
+def get_image_variants(recipe, request):
+    """Адреса готовых вариантов картинки рецепта:
+    {"thumbnail": {"webp": url, ...}, "full": {...}}.
+    Пока варианты текущей картинки не построены - пустой словарь.
+    """
+    if not is_current(recipe):
+        return {}
+    storage = recipe.image.storage
+    urls = {}
+    for variant, files in recipe.image_variants.items():
+        if variant == "source":
+            continue
+        urls[variant] = {}
+        for image_format, name in files.items():
+            url = storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant][image_format] = url
+    return urls
 
 
 class RecipeSmallSerializer(serializers.ModelSerializer):
     """Сериализатор для работы с краткой информацией о рецепте."""
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = (
             "id",
             "name",
             "image",
+            "image_variants",
             "cooking_time"
         )
 
+    def get_image_variants(self, obj):
+        return get_image_variants(obj, self.context.get("request"))
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Сериализатор списка id рецептов для пакетных операций."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+    def validate_recipes(self, value):
+        recipe_ids = list(dict.fromkeys(value))
+        found = set(
+            Recipe.objects.filter(id__in=recipe_ids)
+            .values_list("id", flat=True)
+        )
+        missing = [pk for pk in recipe_ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                [f"Рецепт с id {pk} не существует." for pk in missing]
+            )
+        return recipe_ids
+
+
+class CookQuerySerializer(serializers.Serializer):
+    """Параметры поиска рецептов по имеющимся ингредиентам."""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+    tags = serializers.ListField(
+        child=serializers.SlugField(),
+        required=False
+    )
+    max_cooking_time = serializers.IntegerField(min_value=1, required=False)
+
 
 class UserSubscribeRepresentSerializer(UserGetSerializer):
     """"Сериализатор для предоставления информации
@@ -65,7 +128,6 @@ class UserSubscribeRepresentSerializer(UserGetSerializer):
     """
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = UserFoodgram
@@ -92,16 +154,16 @@ class UserSubscribeRepresentSerializer(UserGetSerializer):
     def get_recipes(self, object):
         request = self.context.get('request')
         context = {'request': request}
-        recipe_limit = request.query_params.get('recipe_limit')
-        queryset = object.recipes.all()
-        if recipe_limit:
-            queryset = queryset[:int(recipe_limit)]
+        if hasattr(object, 'limited_recipes'):
+            queryset = object.limited_recipes
+        else:
+            recipe_limit = request.query_params.get('recipe_limit')
+            queryset = object.recipes.all()
+            if recipe_limit:
+                queryset = queryset[:int(recipe_limit)]
 
         return RecipeSmallSerializer(queryset, context=context, many=True).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class UserSubscribeSerializer(serializers.ModelSerializer):
     """Сериализатор для подписки/отписки от пользователей."""
@@ -196,6 +258,7 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField(required=False)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -208,24 +271,83 @@ class RecipeGetSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_variants",
             "text",
             "cooking_time"
         )
 
+    def get_image_variants(self, obj):
+        return get_image_variants(obj, self.context.get("request"))
+
     def get_is_favorited(self, obj):
         request = self.context.get("request")
-        return (request and request.user.is_authenticated
-                and Favourite.objects.filter(
-                    user=request.user, recipe=obj
-                ).exists())
+        return obj.id in get_user_relations(request).favorites
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get("request")
-        return (
-            request and request.user.is_authenticated
-            and ShoppingCart.objects.filter(
-                user=request.user, recipe=obj
-            ).exists())
+        return obj.id in get_user_relations(request).cart
+
+
+class RecipeReadSerializer(serializers.BaseSerializer):
+    """Быстрый сериализатор рецептов для чтения.
+    Собирает те же словари, что и RecipeGetSerializer, без полей DRF.
+    Рассчитан на рецепты из Recipe.objects.with_related().
+    """
+
+    def to_representation(self, instance):
+        request = self.context.get("request")
+        relations = get_user_relations(request)
+        author = instance.author
+        image = None
+        if instance.image:
+            image = instance.image.url
+            if request is not None:
+                image = request.build_absolute_uri(image)
+        return {
+            "id": instance.id,
+            "tags": [
+                {
+                    "id": tag.id,
+                    "name": tag.name,
+                    "color": tag.color,
+                    "slug": tag.slug,
+                }
+                for tag in instance.tags.all()
+            ],
+            "author": {
+                "email": author.email,
+                "id": author.id,
+                "username": author.username,
+                "first_name": author.first_name,
+                "last_name": author.last_name,
+                "is_subscribed": author.id in relations.subscriptions,
+            },
+            "ingredients": [
+                {
+                    "id": item.ingredient.id,
+                    "name": item.ingredient.name,
+                    "measurement_unit": item.ingredient.measurement_unit,
+                    "amount": item.amount,
+                }
+                for item in instance.recipeingredients.all()
+            ],
+            "is_favorited": instance.id in relations.favorites,
+            "is_in_shopping_cart": instance.id in relations.cart,
+            "name": instance.name,
+            "image": image,
+            "image_variants": get_image_variants(instance, request),
+            "text": instance.text,
+            "cooking_time": instance.cooking_time,
+        }
+
+
+class RecipeCoverageSerializer(RecipeReadSerializer):
+    """Рецепт с долей ингредиентов, которые есть у пользователя."""
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data["coverage"] = round(instance.coverage, 3)
+        return data
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -272,18 +394,21 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=request.user, **validated_data)
         recipe.tags.set(tags)
         create_ingredients(ingredients, recipe)
+        fan_out_recipe.delay(recipe.id)
+        refresh_similar_recipes.delay(recipe.id)
+        process_recipe_image.delay(recipe.id)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop("recipeingredients")
         tags = validated_data.pop("tags")
-        instance.tags.clear()
         instance.tags.set(tags)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
         super().update(instance, validated_data)
-        create_ingredients(ingredients, instance)
-        instance.save()
+        deltas = update_ingredients(ingredients, instance)
+        ShoppingListItem.objects.apply_recipe_deltas(instance.id, deltas)
+        refresh_similar_recipes.delay(instance.id)
+        process_recipe_image.delay(instance.id)
         return instance
 
     def to_representation(self, instance):
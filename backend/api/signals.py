@@ -0,0 +1,59 @@
+from api.authentication import invalidate_tokens
+from api.response_cache import RECIPES, RELATED, bump_versions, recipe_version
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from recipes.images import image_variants_ready
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from rest_framework.authtoken.models import Token
+from users.models import UserFoodgram
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=UserFoodgram)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_tokens(
+            Token.objects.filter(user=instance).values_list("key", flat=True)
+        )
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe_responses(sender, instance, **kwargs):
+    bump_versions(RECIPES, recipe_version(instance.pk))
+
+
+@receiver(image_variants_ready, sender=Recipe)
+def invalidate_recipe_image_responses(sender, recipe_id, **kwargs):
+    bump_versions(RECIPES, recipe_version(recipe_id))
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def invalidate_recipe_ingredient_responses(sender, instance, **kwargs):
+    bump_versions(RECIPES, recipe_version(instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags_responses(sender, instance, action, **kwargs):
+    if action.startswith("post_") and isinstance(instance, Recipe):
+        bump_versions(RECIPES, recipe_version(instance.pk))
+    elif action.startswith("post_"):
+        bump_versions(RELATED)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_related_responses(sender, **kwargs):
+    bump_versions(RELATED)
+
+
+@receiver([post_save, post_delete], sender=UserFoodgram)
+def invalidate_author_responses(
+    sender, created=False, update_fields=None, **kwargs
+):
+    if created or update_fields and set(update_fields) <= {"last_login"}:
+        return
+    bump_versions(RELATED)
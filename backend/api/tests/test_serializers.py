@@ -0,0 +1,52 @@
+from api.management.commands.compare_recipe_serializers import (Command,
+                                                                make_request)
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import TestCase
+from recipes.generator import generate
+from recipes.models import Favourite, Recipe, ShoppingCart
+from users.models import Subscription, UserFoodgram
+
+
+class RecipeReadSerializerTests(TestCase):
+    """RecipeReadSerializer с ORJSONRenderer отдает те же байты,
+    что RecipeGetSerializer с JSONRenderer.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        generate(
+            users=5, recipes=12, ingredients=15, tags=3, seed=1,
+            prefix="serializers"
+        )
+        recipes = list(Recipe.objects.order_by("id"))
+        recipe = recipes[0]
+        Recipe.objects.filter(pk=recipe.pk).update(image_variants={
+            "source": recipe.image.name,
+            "thumbnail": {"webp": "api/images/generated_thumbnail.webp"},
+            "full": {
+                "webp": "api/images/generated_full.webp",
+                "avif": "api/images/generated_full.avif",
+            },
+        })
+        cls.user = UserFoodgram.objects.create_user(
+            username="reader", email="reader@example.com", password="x"
+        )
+        Favourite.objects.add(cls.user.id, [recipes[0].id, recipes[1].id])
+        ShoppingCart.objects.add(cls.user.id, [recipes[1].id])
+        Subscription.objects.create(user=cls.user, author=recipe.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def check_equal(self, user):
+        recipes = list(
+            Recipe.objects.with_related().order_by("-pub_date", "-id")
+        )
+        Command().check_equal(recipes, [make_request(user)])
+
+    def test_anonymous(self):
+        self.check_equal(AnonymousUser())
+
+    def test_authenticated(self):
+        self.check_equal(self.user)
@@ -1,5 +1,7 @@
+from api.async_views import async_patterns, async_view
 from api.views import (IngredientViewSet, RecipeViewSet, TagViewSet,
                        UserSubscribeView, UserSubscriptionsViewSet)
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
@@ -9,12 +11,16 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('tags', TagViewSet, basename='tags')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 
+subscriptions_view = UserSubscriptionsViewSet.as_view({'get': 'list'})
+router_urls = router.urls
+if settings.ASYNC_READ_VIEWS:
+    subscriptions_view = async_view(subscriptions_view)
+    router_urls = async_patterns(router_urls)
 
 urlpatterns = [
-    path('', include(router.urls)),
+    path('users/subscriptions/', subscriptions_view),
+    path('users/<int:user_id>/subscribe/', UserSubscribeView.as_view()),
+    path('', include(router_urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
-    path('users/subscriptions/',
-         UserSubscriptionsViewSet.as_view({'get': 'list'})),
-    path('users/<int:user_id>/subscribe/', UserSubscribeView.as_view()),
 ]
@@ -1,20 +1,16 @@
-from django.db.models import F, Sum
-from django.shortcuts import get_object_or_404
-from recipes.models import Ingredient, RecipeIngredient
+from recipes.models import Ingredient, RecipeIngredient, ShoppingListItem
+from rest_framework import serializers
 
 
 def get_list_ingredients(user):
     """
-    Cуммирование позиций из разных рецептов.
+    Сводный список покупок пользователя.
+    Возвращает кортежи (название, количество, единица измерения).
     """
 
-    ingredients = (
-        RecipeIngredient.objects.filter(recipe__carts__user=user)
-        .values(
-            name=F("ingredient__name"),
-            measurement_unit=F("ingredient__measurement_unit"),
-        )
-        .annotate(amount=Sum("amount"))
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .order_by("ingredient__name")
         .values_list(
             "ingredient__name",
             "amount",
@@ -22,30 +18,67 @@ def get_list_ingredients(user):
         )
     )
 
-    friendly_ingredients = []
-    for ingredient in ingredients:
-        friendly_ingredient = (
-            f"{ingredient[0].capitalize()} - {ingredient[1]} {ingredient[2]}"
-        )
-        friendly_ingredients.append(friendly_ingredient)
 
-    return friendly_ingredients
+def check_ingredients_exist(ingredient_ids):
+    """Проверяет одним запросом, что все ингредиенты существуют."""
+    found = Ingredient.objects.only("id").in_bulk(ingredient_ids)
+    missing = [pk for pk in ingredient_ids if pk not in found]
+    if missing:
+        raise serializers.ValidationError({
+            "ingredients": [
+                f"Ингредиент с id {pk} не существует." for pk in missing
+            ]
+        })
 
 
 def create_ingredients(ingredients, recipe):
     """Вспомогательная функция для добавления ингредиентов.
-    Используется при создании/редактировании рецепта."""
-    ingredient_list = []
-    for ingredient in ingredients:
-        current_ingredient = get_object_or_404(
-            Ingredient,
-            id=ingredient.
-            get("id")
+    Используется при создании рецепта."""
+    check_ingredients_exist([ingredient["id"] for ingredient in ingredients])
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe=recipe,
+            ingredient_id=ingredient["id"],
+            amount=ingredient["amount"]
         )
-        amount = ingredient.get("amount")
-        ingredient_list.append(
-            RecipeIngredient(
-                recipe=recipe, ingredient=current_ingredient, amount=amount
-            )
+        for ingredient in ingredients
+    )
+
+
+def update_ingredients(ingredients, recipe):
+    """Вспомогательная функция для обновления ингредиентов рецепта.
+    Добавляет, изменяет и удаляет только отличающиеся строки.
+    Возвращает изменения количества {id ингредиента: разница}."""
+    current = {
+        recipe_ingredient.ingredient_id: recipe_ingredient
+        for recipe_ingredient in RecipeIngredient.objects.filter(
+            recipe=recipe
         )
-    RecipeIngredient.objects.bulk_create(ingredient_list)
+    }
+    amounts = {
+        ingredient["id"]: ingredient["amount"] for ingredient in ingredients
+    }
+    added = [pk for pk in amounts if pk not in current]
+    check_ingredients_exist(added)
+    deltas = {pk: amounts[pk] for pk in added}
+    changed = []
+    for pk, recipe_ingredient in current.items():
+        amount = amounts.get(pk, 0)
+        if amount != recipe_ingredient.amount:
+            deltas[pk] = amount - recipe_ingredient.amount
+            recipe_ingredient.amount = amount
+            changed.append(recipe_ingredient)
+    removed = [pk for pk in current if pk not in amounts]
+    if removed:
+        RecipeIngredient.objects.filter(
+            recipe=recipe, ingredient_id__in=removed
+        ).delete()
+    RecipeIngredient.objects.bulk_update(
+        [item for item in changed if item.ingredient_id in amounts],
+        ["amount"]
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient_id=pk, amount=amounts[pk])
+        for pk in added
+    )
+    return deltas
@@ -1,11 +1,24 @@
 from api.filters import IngredientFilter, RecipeFilter
-from api.serializers import (IngredientSerializer, RecipeCreateSerializer,
-                             RecipeGetSerializer, RecipeSmallSerializer,
-                             TagSerialiser, UserSubscribeRepresentSerializer,
+from api.pagination import CustomPagination, RecipeCursorPagination
+from api.relations import invalidate_user_relations
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                           ShoppingListTextRenderer)
+from api.response_cache import (RECIPES, RELATED, AnonymousResponseCacheMixin,
+                                recipe_version)
+from api.serializers import (CookQuerySerializer, IngredientSerializer,
+                             RecipeCoverageSerializer, RecipeCreateSerializer,
+                             RecipeIdsSerializer, RecipeReadSerializer,
+                             RecipeSmallSerializer, TagSerialiser,
+                             UserSubscribeRepresentSerializer,
                              UserSubscribeSerializer)
 from api.utils import get_list_ingredients
-from django.shortcuts import HttpResponse, get_object_or_404
+from django.conf import settings
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
+from recipes.feed import backfill_timeline, get_feed, prune_timeline
+from recipes.indexes import ingredient_index, recipe_ingredient_index
 from recipes.models import Favourite, Ingredient, Recipe, ShoppingCart, Tag
 from rest_framework import exceptions, mixins, status, viewsets
 from rest_framework.decorators import action
@@ -27,6 +40,8 @@ class UserSubscribeView(APIView):
         )
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        backfill_timeline(request.user, author)
+        invalidate_user_relations(request.user.id)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, user_id):
@@ -43,6 +58,8 @@ class UserSubscribeView(APIView):
             user=request.user.id,
             author=user_id
         ).delete()
+        prune_timeline(request.user, author)
+        invalidate_user_relations(request.user.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -54,7 +71,22 @@ class UserSubscriptionsViewSet(
     serializer_class = UserSubscribeRepresentSerializer
 
     def get_queryset(self):
-        return UserFoodgram.objects.filter(following__user=self.request.user)
+        user = self.request.user
+        recipes = Recipe.objects.all()
+        recipe_limit = self.request.query_params.get("recipe_limit")
+        if recipe_limit:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef("author")
+                ).values("pk")[:int(recipe_limit)]
+            ))
+        return (
+            UserFoodgram.objects.filter(following__user=user)
+            .prefetch_related(Prefetch(
+                "recipes", queryset=recipes, to_attr="limited_recipes"
+            ))
+            .order_by("id")
+        )
 
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
@@ -74,24 +106,118 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get("limit")
+        return Response(ingredient_index.search(
+            name, limit=int(limit) if limit and limit.isdigit() else None
+        ))
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
     """Работа с рецептами. Создание/изменение/удаление рецепта.
     Получение информации о рецептах.
     Добавление рецептов в избранное и список покупок.
     Отправка файла со списком рецептов.
     """
-    queryset = Recipe.objects.all()
     permission_classes = (IsAdminAuthorOrReadOnly, )
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     http_method_names = ["get", "post", "patch", "delete"]
 
+    @property
+    def paginator(self):
+        """Курсорная пагинация включается параметром pagination=cursor."""
+        if (
+            not hasattr(self, "_paginator")
+            and self.action == "list"
+            and self.request.query_params.get("pagination") == "cursor"
+        ):
+            self._paginator = RecipeCursorPagination()
+        return super().paginator
+
+    def get_queryset(self):
+        queryset = Recipe.objects.all()
+        if self.action == "feed":
+            queryset = get_feed(self.request.user)
+        if self.action in ("list", "retrieve", "feed"):
+            queryset = queryset.with_related()
+        return queryset
+
     def get_serializer_class(self):
-        if self.action in ("list", "retrieve"):
-            return RecipeGetSerializer
+        if self.action in ("list", "retrieve", "feed"):
+            return RecipeReadSerializer
         return RecipeCreateSerializer
 
+    def list(self, request, *args, **kwargs):
+        return self.cached(
+            request, [RECIPES, RELATED], super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(
+            request, [recipe_version(kwargs["pk"]), RELATED],
+            super().retrieve, *args, **kwargs
+        )
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=RecipeCursorPagination
+    )
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь."""
+        return self.list(request)
+
+    @action(detail=False, pagination_class=CustomPagination)
+    def cook(self, request):
+        """Что приготовить: рецепты по имеющимся ингредиентам
+        по убыванию доли ингредиентов, которые уже есть.
+        """
+        data = {
+            name: request.query_params.getlist(name)
+            for name in ("ingredients", "tags")
+        }
+        if "max_cooking_time" in request.query_params:
+            data["max_cooking_time"] = request.query_params["max_cooking_time"]
+        query = CookQuerySerializer(data=data)
+        query.is_valid(raise_exception=True)
+        tag_ids = None
+        if query.validated_data.get("tags"):
+            tag_ids = Tag.objects.filter(
+                slug__in=query.validated_data["tags"]
+            ).values_list("id", flat=True)
+        ids, coverage = recipe_ingredient_index.search(
+            query.validated_data["ingredients"],
+            tag_ids=tag_ids,
+            max_cooking_time=query.validated_data.get("max_cooking_time"),
+        )
+        coverage = dict(zip(ids.tolist(), coverage.tolist()))
+        page = self.paginate_queryset(list(coverage))
+        recipes = Recipe.objects.with_related().in_bulk(page)
+        for recipe in recipes.values():
+            recipe.coverage = coverage[recipe.id]
+        serializer = RecipeCoverageSerializer(
+            [recipes[pk] for pk in page if pk in recipes],
+            many=True,
+            context={"request": request}
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """Похожие рецепты по ингредиентам и тегам."""
+        get_object_or_404(Recipe.objects.only("id"), pk=pk)
+        recipes = Recipe.objects.filter(similar_to__recipe_id=pk).order_by(
+            "-similar_to__score", "id"
+        )[:settings.SIMILAR_RECIPES_COUNT]
+        serializer = RecipeSmallSerializer(
+            recipes, many=True, context={"request": request}
+        )
+        return Response(serializer.data)
+
     @action(
         methods=["POST", "DELETE"],
         detail=True,
@@ -117,18 +243,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def add_to_favorites(self, user, recipe):
         """Создание инстанса"""
-        if Favourite.objects.filter(user=user, recipe=recipe).exists():
+        if not Favourite.objects.add(user.id, [recipe.id]):
             raise exceptions.ValidationError("Рецепт уже в избранном.")
-        Favourite.objects.create(user=user, recipe=recipe)
+        invalidate_user_relations(user.id)
 
     def remove_from_favorites(self, user, recipe):
         """Удаление инстанса"""
-        if not Favourite.objects.filter(user=user, recipe=recipe).exists():
+        if not Favourite.objects.remove(user.id, [recipe.id]):
             raise exceptions.ValidationError(
                 "Рецепта нет в избранном, либо он уже удален."
             )
-        favorite = get_object_or_404(Favourite, user=user, recipe=recipe)
-        favorite.delete()
+        invalidate_user_relations(user.id)
 
     @action(
         detail=True,
@@ -157,42 +282,81 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def create_shopping_cart(self, user, recipe):
         """Создание инстанса"""
-        if ShoppingCart.objects.filter(
-            user=user,
-            recipe=recipe
-        ).exists():
+        if not ShoppingCart.objects.add(user.id, [recipe.id]):
             raise exceptions.ValidationError(
                 "Рецепт уже в списке покупок."
             )
-
-        ShoppingCart.objects.create(user=user, recipe=recipe)
+        invalidate_user_relations(user.id)
 
     def delete_shopping_cart(self, user, recipe):
         """Удаление инстанса"""
-        if not ShoppingCart.objects.filter(
-            user=user,
-            recipe=recipe
-        ).exists():
+        if not ShoppingCart.objects.remove(user.id, [recipe.id]):
             raise exceptions.ValidationError(
                 "Рецепта нет в списке покупок, либо он уже удален."
             )
+        invalidate_user_relations(user.id)
 
-        shopping_cart = get_object_or_404(
-            ShoppingCart,
-            user=user,
-            recipe=recipe
+    def batch_update(self, request, model):
+        """Добавление/удаление нескольких рецептов одним запросом.
+        Уже добавленные и уже удаленные рецепты пропускаются.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data["recipes"]
+        user_id = request.user.id
+        if request.method == "DELETE":
+            if model.objects.remove(user_id, recipe_ids):
+                invalidate_user_relations(user_id)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        added = model.objects.add(user_id, recipe_ids)
+        if added:
+            invalidate_user_relations(user_id)
+        serializer = RecipeSmallSerializer(
+            Recipe.objects.filter(id__in=added),
+            many=True,
+            context={"request": request}
         )
-        shopping_cart.delete()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(
         detail=False,
+        methods=["post", "delete"],
+        url_path="favorite",
+        permission_classes=[IsAuthenticated]
     )
-    def download_shopping_cart(self, request):
-        """Отправка файла со списком покупок."""
-        text = get_list_ingredients(request.user)
+    def favorite_batch(self, request):
+        """Добавление/удаление нескольких рецептов в избранном."""
+        return self.batch_update(request, Favourite)
 
-        response = HttpResponse(text, content_type="text/plain")
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="shopping_cart",
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_cart_batch(self, request):
+        """Добавление/удаление нескольких рецептов в списке покупок."""
+        return self.batch_update(request, ShoppingCart)
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            ShoppingListTextRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListJSONRenderer,
+        ],
+    )
+    def download_shopping_cart(self, request):
+        """Отправка файла со списком покупок.
+        Формат выбирается параметром format: txt, csv или json.
+        """
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(get_list_ingredients(request.user).iterator()),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}"
+        )
         response["Content-Disposition"] = (
-            'attachment;filename="shopping_cart.txt"'
+            f'attachment;filename="shopping_cart.{renderer.format}"'
         )
         return response
@@ -37,9 +37,12 @@ INSTALLED_APPS = [
     'api',
     'users',
     'recipes',
+    'tasks',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestStatsMiddleware',
+    'api.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +87,44 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения через запятую: хосты PostgreSQL
+# или файлы SQLite для локальной проверки.
+# Клиент, изменивший данные, REPLICA_PIN_SECONDS секунд
+# читает с основной базы.
+
+REPLICA_OPTION = (
+    'NAME' if DATABASES['default']['ENGINE'].endswith('sqlite3') else 'HOST'
+)
+DATABASE_REPLICAS = []
+for index, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', default='').split(','))
+):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        REPLICA_OPTION: replica.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', default=5))
+
+# Cache
+# Локально используется LocMemCache, в продакшене - Redis:
+# CACHE_BACKEND=django_redis.cache.RedisCache
+# CACHE_LOCATION=redis://redis:6379/0
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -143,7 +184,11 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPagination',
     'PAGE_SIZE': 6,
@@ -164,3 +209,52 @@ DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
 }
+
+
+# Лента подписок: рецепты авторов, у которых при публикации больше
+# FEED_FANOUT_LIMIT подписчиков, не рассылаются по лентам,
+# а добавляются при чтении.
+FEED_FANOUT_LIMIT = 1000
+FEED_BACKFILL_SIZE = 100
+
+
+# Похожие рецепты: сходство по ингредиентам, усиленное сходством по тегам
+# с весом SIMILAR_RECIPES_TAG_WEIGHT, см. recipes.similar.
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_RECIPES_TAG_WEIGHT = 0.5
+
+
+# Заголовок Server-Timing и журнал запросов, в которых больше
+# REQUEST_STATS_QUERY_BUDGET SQL-запросов
+# или которые дольше REQUEST_STATS_TIME_BUDGET мс.
+REQUEST_STATS = os.getenv('REQUEST_STATS', default='False') == 'True'
+REQUEST_STATS_QUERY_BUDGET = 20
+REQUEST_STATS_TIME_BUDGET = 500
+
+
+# Фоновые задачи в базе данных, см. tasks.queue. Их выполняет
+# manage.py run_worker, а при TASKS_EAGER=True - процесс, поставивший
+# задачу, после фиксации транзакции, без воркера.
+# Упавшая задача повторяется через TASKS_RETRY_DELAY секунд,
+# задержка удваивается с каждой попыткой. Задача воркера, который
+# TASKS_LOCK_TIMEOUT секунд не обновлял ее отметку, возвращается в очередь.
+TASKS_EAGER = os.getenv('TASKS_EAGER', default='True') == 'True'
+TASKS_MAX_ATTEMPTS = 3
+TASKS_RETRY_DELAY = 10
+TASKS_LOCK_TIMEOUT = 600
+TASKS_KEEP_DONE_HOURS = 24
+
+
+# Варианты картинок рецептов строятся фоновой задачей, см. recipes.images:
+# миниатюра обрезается до RECIPE_THUMBNAIL_SIZE, полная картинка
+# уменьшается до RECIPE_IMAGE_MAX_SIZE. Форматы, которые не поддерживает
+# установленный Pillow, пропускаются.
+RECIPE_THUMBNAIL_SIZE = (480, 320)
+RECIPE_IMAGE_MAX_SIZE = (1280, 1280)
+RECIPE_IMAGE_FORMATS = ['webp', 'avif']
+
+
+# Развертывание под ASGI: gunicorn с воркерами uvicorn
+# и асинхронные представления для чтения рецептов, тегов,
+# ингредиентов и подписок.
+ASYNC_READ_VIEWS = os.getenv('ASGI', default='False') == 'True'
@@ -0,0 +1,10 @@
+import os
+
+bind = "0:8000"
+workers = int(os.getenv("GUNICORN_WORKERS", default="1"))
+
+if os.getenv("ASGI", default="False") == "True":
+    wsgi_app = "foodgram.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "foodgram.wsgi:application"
@@ -0,0 +1,53 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favourite, Recipe, ShoppingCart
+from users.models import Subscription, UserFoodgram
+
+# Счетчик, модель связей и поле связи, по которому он считается.
+COUNTERS = {
+    Recipe: [
+        ("favorites_count", Favourite, "recipe"),
+        ("carts_count", ShoppingCart, "recipe"),
+    ],
+    UserFoodgram: [
+        ("recipes_count", Recipe, "author"),
+        ("followers_count", Subscription, "author"),
+    ],
+}
+
+
+def actual_count(model, field):
+    """Подзапрос с настоящим числом связей для строки внешнего запроса."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0
+    )
+
+
+def reconcile_counters(recipes=None, users=None):
+    """Пересчитывает счетчики, которые разошлись со связями.
+    Возвращает число исправленных строк по каждому счетчику.
+    """
+    querysets = {
+        Recipe: Recipe.objects.all() if recipes is None else recipes,
+        UserFoodgram: UserFoodgram.objects.all() if users is None else users,
+    }
+    fixed = {}
+    for model, counters in COUNTERS.items():
+        for counter, related, field in counters:
+            stale = (
+                querysets[model].order_by()
+                .annotate(actual=actual_count(related, field))
+                .exclude(**{counter: F("actual")})
+            )
+            fixed[f"{model.__name__}.{counter}"] = (
+                model.objects.filter(pk__in=stale.values("pk"))
+                .update(**{counter: actual_count(related, field)})
+            )
+    return fixed
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.db.models import Q
+from recipes.models import Recipe, TimelineEntry
+from tasks.queue import task
+from users.models import Subscription, UserFoodgram
+
+
+def is_large_author(author_id):
+    """У автора слишком много подписчиков для рассылки при публикации."""
+    return UserFoodgram.objects.filter(
+        pk=author_id, followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).exists()
+
+
+@task()
+def fan_out_recipe(recipe_id):
+    """Добавляет новый рецепт в ленты подписчиков автора
+    и отмечает его разосланным. Рецепты крупных авторов
+    не рассылаются и попадают в ленту при чтении.
+    """
+    author_id = Recipe.objects.filter(pk=recipe_id).values_list(
+        "author_id", flat=True
+    ).first()
+    if author_id is None or is_large_author(author_id):
+        return
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+            for user_id in Subscription.objects.filter(
+                author=author_id
+            ).values_list("user_id", flat=True)
+        ),
+        ignore_conflicts=True
+    )
+    Recipe.objects.filter(pk=recipe_id).update(fanned_out=True)
+
+
+def backfill_timeline(user, author):
+    """Добавляет в ленту последние разосланные рецепты автора
+    после подписки. Остальные его рецепты лента берет при чтении.
+    """
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user=user, recipe_id=recipe_id)
+            for recipe_id in Recipe.objects.filter(
+                author=author, fanned_out=True
+            ).values_list("id", flat=True)[:settings.FEED_BACKFILL_SIZE]
+        ),
+        ignore_conflicts=True
+    )
+
+
+def prune_timeline(user, author):
+    """Убирает рецепты автора из ленты после отписки."""
+    TimelineEntry.objects.filter(user=user, recipe__author=author).delete()
+
+
+def get_feed(user):
+    """Рецепты авторов, на которых подписан пользователь:
+    разосланные - из ленты, остальные - по подпискам.
+    Крупность автора решается при публикации, поэтому рецепты
+    не пропадают, когда число подписчиков меняется.
+    """
+    authors = Subscription.objects.filter(user=user).values("author")
+    return Recipe.objects.filter(
+        Q(pk__in=TimelineEntry.objects.filter(user=user).values("recipe"))
+        | Q(author__in=authors, fanned_out=False)
+    )
@@ -0,0 +1,264 @@
+import random
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+from recipes.counters import reconcile_counters
+from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, Tag, TimelineEntry)
+from recipes.search import index_recipes
+from users.models import Subscription, UserFoodgram
+
+DISHES = [
+    "суп", "салат", "пирог", "каша", "омлет", "паста", "рагу", "плов",
+    "блины", "запеканка", "котлеты", "суфле", "ризотто", "борщ", "лазанья",
+]
+PRODUCTS = [
+    "курица", "говядина", "рыба", "грибы", "сыр", "картофель", "морковь",
+    "тыква", "рис", "гречка", "яблоки", "творог", "шпинат", "фасоль",
+    "томаты", "кабачки", "лосось", "креветки", "баклажаны", "горох",
+]
+STEPS = [
+    "нарезать", "смешать", "обжарить", "запечь", "посолить", "варить",
+    "остудить", "подавать", "взбить", "тушить", "залить", "посыпать",
+]
+UNITS = ["г", "кг", "мл", "л", "шт", "ст. л.", "ч. л.", "по вкусу"]
+BATCH_SIZE = 1000
+
+
+class Skewed:
+    """Случайный выбор с законом Ципфа: элемент с рангом r
+    выбирается с весом 1 / r ** skew. Первые элементы популярнее.
+    """
+
+    def __init__(self, rng, items, skew):
+        self.rng = rng
+        self.items = items
+        self.weights = list(accumulate(
+            1 / rank ** skew for rank in range(1, len(items) + 1)
+        ))
+
+    def choice(self):
+        return self.rng.choices(self.items, cum_weights=self.weights)[0]
+
+    def sample(self, count):
+        """До count разных элементов."""
+        count = min(count, len(self.items))
+        chosen = {}
+        for _ in range(count * 3):
+            item = self.choice()
+            chosen[id(item)] = item
+            if len(chosen) == count:
+                break
+        return list(chosen.values())
+
+
+def activity(rng, mean):
+    """Число действий пользователя: у большинства мало, у немногих много."""
+    return int(rng.expovariate(1 / mean)) if mean else 0
+
+
+def _created(queryset):
+    # bulk_create на SQLite не возвращает id, поэтому строки перечитываются.
+    return list(queryset.order_by("id"))
+
+
+@transaction.atomic
+def generate(
+    users=1000, recipes=10000, ingredients=2000, tags=10, favorites=20,
+    cart=5, subscriptions=10, skew=1.1, days=365, seed=None, prefix=None,
+):
+    """Создает синтетических пользователей, теги, ингредиенты и рецепты,
+    избранное, корзины и подписки с неравномерным распределением:
+    немногие авторы пишут большинство рецептов и собирают большинство
+    подписчиков, немногие рецепты собирают большинство добавлений.
+    Возвращает число созданных строк по моделям.
+    """
+    rng = random.Random(seed)
+    prefix = prefix or f"gen{uuid.uuid4().hex[:8]}"
+    password = make_password(None)
+    UserFoodgram.objects.bulk_create(
+        (
+            UserFoodgram(
+                username=f"{prefix}_user_{i}",
+                email=f"{prefix}_user_{i}@example.com",
+                first_name=f"Имя {i}",
+                last_name=f"Фамилия {i}",
+                password=password,
+            )
+            for i in range(users)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    generated_users = UserFoodgram.objects.filter(
+        username__startswith=f"{prefix}_user_"
+    )
+    user_list = _created(generated_users)
+    # bulk_create не вызывает pre_save, биты маски назначаются здесь.
+    free_bits = Tag.objects.free_bits()
+    if tags > len(free_bits):
+        raise ValueError(f"Свободных битов маски тегов: {len(free_bits)}.")
+    Tag.objects.bulk_create(
+        Tag(
+            name=f"{prefix} тег {i}",
+            slug=f"{prefix}_tag_{i}",
+            color=f"#{rng.randrange(0x1000000):06x}",
+            bit=bit,
+        )
+        for i, bit in zip(range(tags), free_bits)
+    )
+    tag_list = _created(Tag.objects.filter(slug__startswith=f"{prefix}_tag_"))
+    Ingredient.objects.bulk_create(
+        (
+            Ingredient(
+                name=f"{rng.choice(PRODUCTS)} {prefix} {i}",
+                measurement_unit=rng.choice(UNITS),
+            )
+            for i in range(ingredients)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    ingredient_list = _created(
+        Ingredient.objects.filter(name__contains=f" {prefix} ")
+    )
+    authors = Skewed(rng, user_list, skew)
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                author=authors.choice(),
+                name=f"{rng.choice(DISHES)} с {rng.choice(PRODUCTS)} {i}",
+                text=" ".join(rng.choices(STEPS, k=30)),
+                image="api/images/generated.png",
+                cooking_time=rng.randint(1, 180),
+            )
+            for i in range(recipes)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    recipe_list = _created(Recipe.objects.filter(author__in=generated_users))
+    # pub_date заполняется при вставке, даты публикации разносятся
+    # по последним days дням отдельным обновлением.
+    now = timezone.now()
+    for recipe in recipe_list:
+        recipe.pub_date = now - timedelta(seconds=rng.randrange(days * 86400))
+    Recipe.objects.bulk_update(recipe_list, ["pub_date"], BATCH_SIZE)
+    index_recipes(recipe_list)
+
+    popular_tags = Skewed(rng, tag_list, skew)
+    Recipe.tags.through.objects.bulk_create(
+        (
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipe_list
+            for tag in popular_tags.sample(rng.randint(1, 3))
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    popular_ingredients = Skewed(rng, ingredient_list, skew)
+    RecipeIngredient.objects.bulk_create(
+        (
+            RecipeIngredient(
+                recipe=recipe, ingredient=ingredient,
+                amount=rng.randint(1, 500),
+            )
+            for recipe in recipe_list
+            for ingredient in popular_ingredients.sample(rng.randint(3, 12))
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    popular_recipes = Skewed(rng, recipe_list, skew)
+    for model, mean in ((Favourite, favorites), (ShoppingCart, cart)):
+        model.objects.bulk_create(
+            (
+                model(user=user, recipe=recipe)
+                for user in user_list
+                for recipe in popular_recipes.sample(activity(rng, mean))
+            ),
+            batch_size=BATCH_SIZE,
+        )
+    Subscription.objects.bulk_create(
+        (
+            Subscription(user=user, author=author)
+            for user in user_list
+            for author in authors.sample(activity(rng, subscriptions))
+            if author != user
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    _fill_derived(generated_users, recipe_list)
+    analyze()
+    return {
+        "users": len(user_list),
+        "tags": len(tag_list),
+        "ingredients": len(ingredient_list),
+        "recipes": len(recipe_list),
+        **{
+            name: model.objects.filter(user__in=generated_users).count()
+            for name, model in (
+                ("favorites", Favourite),
+                ("cart", ShoppingCart),
+                ("subscriptions", Subscription),
+            )
+        },
+    }
+
+
+def _fill_derived(generated_users, recipe_list):
+    """Заполняет ленты, списки покупок, счетчики и маски тегов,
+    которые bulk_create обходит вместе с сигналами.
+    """
+    recipe_list = sorted(recipe_list, key=lambda recipe: recipe.pub_date)
+    recipes_by_author = defaultdict(list)
+    for recipe in recipe_list:
+        recipes_by_author[recipe.author_id].append(recipe.id)
+    followers = defaultdict(list)
+    for user_id, author_id in Subscription.objects.filter(
+        user__in=generated_users
+    ).values_list("user_id", "author_id"):
+        followers[author_id].append(user_id)
+    large_authors = {
+        author_id for author_id, user_ids in followers.items()
+        if len(user_ids) > settings.FEED_FANOUT_LIMIT
+    }
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+            for author_id, user_ids in followers.items()
+            if author_id not in large_authors
+            for user_id in user_ids
+            for recipe_id in recipes_by_author[author_id][
+                -settings.FEED_BACKFILL_SIZE:
+            ]
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    carts = defaultdict(list)
+    for user_id, recipe_id in ShoppingCart.objects.filter(
+        user__in=generated_users
+    ).values_list("user_id", "recipe_id"):
+        carts[user_id].append(recipe_id)
+    for user_id, recipe_ids in carts.items():
+        ShoppingListItem.objects.add_recipes(user_id, recipe_ids)
+    generated_recipes = Recipe.objects.filter(author__in=generated_users)
+    generated_recipes.exclude(author__in=large_authors).update(
+        fanned_out=True
+    )
+    reconcile_counters(recipes=generated_recipes, users=generated_users)
+    generated_recipes.update_tags_masks()
+
+
+def analyze():
+    """Обновляет статистику планировщика после массовой вставки."""
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        # Без VACUUM новые строки остаются в списке ожидания GIN-индекса,
+        # и планировщик считает поиск по индексу дороже полного чтения.
+        cursor.execute(
+            "SELECT gin_clean_pending_list('recipes_recipe_search_vector_idx')"
+        )
+        cursor.execute("ANALYZE")
@@ -0,0 +1,116 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+from recipes.models import Recipe
+from tasks.models import Task
+from tasks.queue import task
+
+# Параметры кодирования форматов вариантов.
+SAVE_OPTIONS = {
+    "webp": {"quality": 80, "method": 4},
+    "avif": {"quality": 60},
+}
+
+# Отправляется после сохранения новых вариантов картинки рецепта.
+image_variants_ready = Signal()
+
+
+def formats():
+    """Форматы из RECIPE_IMAGE_FORMATS, которые умеет сохранять Pillow."""
+    Image.init()
+    return [
+        name for name in settings.RECIPE_IMAGE_FORMATS
+        if name.upper() in Image.SAVE
+    ]
+
+
+def resize(image, variant):
+    """Миниатюра обрезается точно по размеру, полная картинка
+    только уменьшается, если не влезает в RECIPE_IMAGE_MAX_SIZE.
+    """
+    if variant == "thumbnail":
+        return ImageOps.fit(
+            image, settings.RECIPE_THUMBNAIL_SIZE, Image.LANCZOS
+        )
+    image = image.copy()
+    image.thumbnail(settings.RECIPE_IMAGE_MAX_SIZE, Image.LANCZOS)
+    return image
+
+
+def save(image, name, image_format):
+    buffer = BytesIO()
+    image.save(buffer, image_format.upper(), **SAVE_OPTIONS.get(
+        image_format, {}
+    ))
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def render_variants(name):
+    """Сохраняет рядом с картинкой name миниатюру и полную картинку
+    во всех форматах. Возвращает {вариант: {формат: имя файла}}
+    и имя исходной картинки под ключом source.
+    """
+    root = os.path.splitext(name)[0]
+    with default_storage.open(name) as file, Image.open(file) as source:
+        source = ImageOps.exif_transpose(source)
+        source = source.convert(
+            "RGBA" if "A" in source.getbands() else "RGB"
+        )
+        variants = {"source": name}
+        for variant in ("thumbnail", "full"):
+            image = resize(source, variant)
+            variants[variant] = {
+                image_format: save(
+                    image, f"{root}_{variant}.{image_format}", image_format
+                )
+                for image_format in formats()
+            }
+    return variants
+
+
+def delete_variants(variants):
+    for variant, files in variants.items():
+        if variant != "source":
+            for name in files.values():
+                default_storage.delete(name)
+
+
+def is_current(recipe):
+    """Варианты построены из текущей картинки рецепта."""
+    return bool(recipe.image) and (
+        recipe.image_variants.get("source") == recipe.image.name
+    )
+
+
+@task(priority=Task.Priority.HIGH)
+def process_recipe_image(recipe_id, force=False):
+    """Строит варианты картинки рецепта и удаляет варианты прежней.
+    Если картинку заменили во время обработки, результат выбрасывается:
+    новую картинку обработает своя задача.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        "image", "image_variants"
+    ).first()
+    if recipe is None or not recipe.image or (
+        is_current(recipe) and not force
+    ):
+        return
+    if not default_storage.exists(recipe.image.name):
+        return
+    variants = render_variants(recipe.image.name)
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=recipe.image.name
+    ).update(image_variants=variants)
+    if not updated:
+        delete_variants(variants)
+        return
+    if recipe.image_variants.get("source") != recipe.image.name:
+        delete_variants(recipe.image_variants)
+    image_variants_ready.send(sender=Recipe, recipe_id=recipe_id)
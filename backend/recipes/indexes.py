@@ -0,0 +1,267 @@
+from bisect import bisect_left
+from threading import Lock
+from uuid import uuid4
+
+import numpy as np
+from django.core.cache import cache
+from django.db import router, transaction
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+JOURNAL_TIMEOUT = 60 * 60
+EMPTY = np.zeros(0, dtype=np.int64)
+
+
+class LazyIndex:
+    """Индекс в памяти процесса.
+    Строится при первом обращении и перестраивается,
+    когда меняется его версия в общем кэше.
+    """
+    version_key = None
+
+    def __init__(self):
+        self._lock = Lock()
+        self._data = None
+        self._version = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def get(self):
+        version = cache.get(self.version_key)
+        if self._data is None or version != self._version:
+            with self._lock:
+                if self._data is None or version != self._version:
+                    self._data = self.build()
+                    self._version = version
+        return self._data
+
+    def invalidate(self):
+        """Меняет версию после фиксации транзакции, иначе другой
+        процесс мог бы перестроить индекс без изменения и сохранить
+        результат под новой версией.
+        """
+        def bump():
+            self._data = None
+            cache.set(self.version_key, uuid4().hex, None)
+
+        transaction.on_commit(bump)
+
+
+class IngredientPrefixIndex(LazyIndex):
+    """Отсортированный индекс названий ингредиентов для автодополнения.
+    Как и RecipeIngredientIndex, читает основную базу.
+    """
+    version_key = "indexes:ingredients:version"
+
+    def build(self):
+        rows = sorted(
+            Ingredient.objects.using(
+                router.db_for_write(Ingredient)
+            ).values("id", "name", "measurement_unit"),
+            key=lambda row: (row["name"].casefold(), row["id"])
+        )
+        return [row["name"].casefold() for row in rows], rows
+
+    def search(self, prefix, limit=None):
+        """Ингредиенты, название которых начинается с prefix.
+        Точные совпадения идут первыми, остальные - по алфавиту.
+        """
+        keys, rows = self.get()
+        prefix = prefix.casefold()
+        result = []
+        position = bisect_left(keys, prefix)
+        while (
+            position < len(keys)
+            and keys[position].startswith(prefix)
+            and (limit is None or len(result) < limit)
+        ):
+            result.append(rows[position])
+            position += 1
+        return result
+
+
+class JournaledIndex(LazyIndex):
+    """Индекс, в который изменения отдельных объектов вносятся
+    без полной перестройки. Id измененных объектов записываются
+    в журнал в общем кэше, каждый процесс применяет новые записи
+    при следующем обращении. Если записей больше journal_size
+    или часть уже вытеснена из кэша, индекс строится заново.
+    """
+    journal_key = None
+    journal_size = 1000
+
+    def __init__(self):
+        super().__init__()
+        self._revision = 0
+
+    def update(self, data, ids):
+        raise NotImplementedError
+
+    def changed(self, ids):
+        """Записывает изменение объектов после фиксации транзакции."""
+        ids = list(ids)
+
+        def record():
+            cache.add(self.journal_key, 0, None)
+            revision = cache.incr(self.journal_key)
+            cache.set(f"{self.journal_key}:{revision}", ids, JOURNAL_TIMEOUT)
+
+        transaction.on_commit(record)
+
+    def get(self):
+        state = cache.get_many([self.version_key, self.journal_key])
+        version = state.get(self.version_key)
+        revision = state.get(self.journal_key, 0)
+        if (
+            self._data is not None
+            and version == self._version
+            and revision == self._revision
+        ):
+            return self._data
+        with self._lock:
+            if self._data is None or version != self._version:
+                self._data = self.build()
+            elif revision > self._revision:
+                self._data = self.replay(revision)
+            self._version = version
+            self._revision = revision
+        return self._data
+
+    def replay(self, revision):
+        if revision - self._revision > self.journal_size:
+            return self.build()
+        keys = [
+            f"{self.journal_key}:{number}"
+            for number in range(self._revision + 1, revision + 1)
+        ]
+        entries = cache.get_many(keys)
+        if len(entries) < len(keys):
+            return self.build()
+        return self.update(
+            self._data, {pk for ids in entries.values() for pk in ids}
+        )
+
+
+class RecipeIngredientIndex(JournaledIndex):
+    """Обратный индекс: ингредиент и тег -> упорядоченный массив id
+    рецептов, плюс число ингредиентов и время приготовления рецептов.
+    Строится с основной базы, чтобы не взять отстающие данные реплики.
+    """
+    version_key = "indexes:recipe_ingredients:version"
+    journal_key = "indexes:recipe_ingredients:journal"
+
+    def rows(self, recipe_ids=None):
+        """Рецепты, их ингредиенты и теги одним набором запросов."""
+        database = router.db_for_write(Recipe)
+        recipes = Recipe.objects.using(database).order_by("id")
+        ingredients = RecipeIngredient.objects.using(database)
+        tags = Recipe.tags.through.objects.using(database)
+        if recipe_ids is not None:
+            recipes = recipes.filter(id__in=recipe_ids)
+            ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+            tags = tags.filter(recipe_id__in=recipe_ids)
+        return (
+            np.array(
+                list(recipes.values_list("id", "cooking_time")),
+                dtype=np.int64,
+            ).reshape(-1, 2),
+            np.array(
+                list(ingredients.values_list("ingredient_id", "recipe_id")),
+                dtype=np.int64,
+            ).reshape(-1, 2),
+            np.array(
+                list(tags.values_list("tag_id", "recipe_id")),
+                dtype=np.int64,
+            ).reshape(-1, 2),
+        )
+
+    @staticmethod
+    def postings(pairs):
+        """Пары (ключ, id рецепта) -> {ключ: упорядоченные id рецептов}."""
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        keys, starts = np.unique(pairs[:, 0], return_index=True)
+        return dict(zip(keys.tolist(), np.split(pairs[:, 1], starts[1:])))
+
+    def build(self):
+        recipes, ingredients, tags = self.rows()
+        ids, sizes = np.unique(ingredients[:, 1], return_counts=True)
+        recipe_sizes = np.zeros(len(recipes), dtype=np.int64)
+        positions = np.searchsorted(recipes[:, 0], ids)
+        known = positions < len(recipes)
+        known[known] = recipes[positions[known], 0] == ids[known]
+        recipe_sizes[positions[known]] = sizes[known]
+        ingredients = ingredients[np.isin(ingredients[:, 1], recipes[:, 0])]
+        return {
+            "recipes": recipes[:, 0].copy(),
+            "cooking_times": recipes[:, 1].copy(),
+            "sizes": recipe_sizes,
+            "ingredients": self.postings(ingredients),
+            "tags": self.postings(tags),
+        }
+
+    def update(self, data, ids):
+        """Удаляет рецепты ids из индекса и добавляет заново
+        те, что еще существуют.
+        """
+        ids = np.array(sorted(ids), dtype=np.int64)
+        recipes, ingredients, tags = self.rows(ids.tolist())
+        ingredients = ingredients[np.isin(ingredients[:, 1], recipes[:, 0])]
+        sizes = np.zeros(len(recipes), dtype=np.int64)
+        np.add.at(sizes, np.searchsorted(recipes[:, 0], ingredients[:, 1]), 1)
+        keep = ~np.isin(data["recipes"], ids)
+        merged = np.concatenate([data["recipes"][keep], recipes[:, 0]])
+        order = np.argsort(merged, kind="stable")
+        result = {
+            "recipes": merged[order],
+            "cooking_times": np.concatenate(
+                [data["cooking_times"][keep], recipes[:, 1]]
+            )[order],
+            "sizes": np.concatenate([data["sizes"][keep], sizes])[order],
+        }
+        for name, pairs in (("ingredients", ingredients), ("tags", tags)):
+            postings = dict(data[name])
+            for key, recipe_ids in postings.items():
+                positions = np.searchsorted(recipe_ids, ids)
+                found = positions < len(recipe_ids)
+                found[found] = recipe_ids[positions[found]] == ids[found]
+                if found.any():
+                    postings[key] = np.delete(recipe_ids, positions[found])
+            for key, recipe_ids in self.postings(pairs).items():
+                postings[key] = np.union1d(
+                    postings.get(key, EMPTY), recipe_ids
+                )
+            result[name] = postings
+        return result
+
+    def search(self, ingredient_ids, tag_ids=None, max_cooking_time=None):
+        """Рецепты, в которых есть хотя бы один ингредиент из
+        ingredient_ids, по убыванию доли имеющихся ингредиентов.
+        Теги отбирают рецепты хотя бы с одним из tag_ids.
+        Возвращает массивы id рецептов и долей.
+        """
+        data = self.get()
+        postings = [
+            data["ingredients"][pk] for pk in set(ingredient_ids)
+            if pk in data["ingredients"]
+        ]
+        if not postings:
+            return EMPTY, np.zeros(0)
+        ids, counts = np.unique(np.concatenate(postings), return_counts=True)
+        positions = np.searchsorted(data["recipes"], ids)
+        coverage = counts / data["sizes"][positions]
+        selected = np.ones(len(ids), dtype=bool)
+        if max_cooking_time is not None:
+            selected &= data["cooking_times"][positions] <= max_cooking_time
+        if tag_ids is not None:
+            selected &= np.isin(ids, np.concatenate([EMPTY] + [
+                data["tags"].get(pk, EMPTY) for pk in tag_ids
+            ]))
+        ids, coverage, counts = (
+            ids[selected], coverage[selected], counts[selected]
+        )
+        order = np.lexsort((ids, -counts, -coverage))
+        return ids[order], coverage[order]
+
+
+ingredient_index = IngredientPrefixIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,77 @@
+import time
+
+from api.management.commands.benchmark_api import percentile
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from recipes.models import Recipe, Tag
+
+
+def tag_sets(tags):
+    """Наборы тегов фильтра: самый популярный, два популярных,
+    самый редкий и половина всех тегов.
+    """
+    return {
+        "popular": tags[:1],
+        "two_popular": tags[:2],
+        "rare": tags[-1:],
+        "half": tags[:max(len(tags) // 2, 1)],
+    }
+
+
+def join_filter(tags):
+    """Прежний фильтр: соединение с таблицей связей и DISTINCT."""
+    return Recipe.objects.filter(
+        tags__slug__in=[tag.slug for tag in tags]
+    ).distinct()
+
+
+def mask_filter(tags):
+    return Recipe.objects.with_any_tag(tags)
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает фильтр рецептов по тегам через соединение "
+        "с фильтром по маске тегов: первая страница и число рецептов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--limit", type=int, default=6)
+
+    def handle(self, *args, **options):
+        tags = list(
+            Tag.objects.annotate(recipes_count=Count("tags"))
+            .order_by("-recipes_count", "id")
+        )
+        if not tags:
+            raise CommandError("Нет тегов, используйте generate_data.")
+        queries = {
+            "page": lambda queryset: list(
+                queryset.order_by("-pub_date", "-id")
+                .values_list("id", flat=True)[:options["limit"]]
+            ),
+            "count": lambda queryset: queryset.count(),
+        }
+        for name, selected in tag_sets(tags).items():
+            for query, run in queries.items():
+                results = {}
+                timings = {}
+                for method, build in (
+                    ("join", join_filter), ("mask", mask_filter)
+                ):
+                    durations = []
+                    for _ in range(options["repeat"]):
+                        start = time.perf_counter()
+                        results[method] = run(build(selected))
+                        durations.append(time.perf_counter() - start)
+                    timings[method] = percentile(durations, 50) * 1000
+                if results["join"] != results["mask"]:
+                    raise CommandError(
+                        f"{name} {query}: результаты фильтров различаются"
+                    )
+                self.stdout.write(
+                    f"{name:12} {query:6} join={timings['join']:8.2f}ms "
+                    f"mask={timings['mask']:8.2f}ms "
+                    f"x{timings['join'] / timings['mask']:.1f}"
+                )
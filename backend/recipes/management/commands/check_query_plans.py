@@ -0,0 +1,169 @@
+import json
+
+from api.utils import get_list_ingredients
+from api.views import RecipeViewSet, UserSubscriptionsViewSet
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.generator import DISHES, generate
+from recipes.models import Tag
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+from users.models import UserFoodgram
+
+# recipes_ingredient - справочник, он загружается из фикстуры и не растет
+# вместе с рецептами. Автодополнение отвечает из индекса в памяти,
+# который читает таблицу целиком при построении, а в остальных запросах
+# ингредиенты присоединяются к уже отобранным строкам.
+LARGE_TABLES = {
+    "recipes_recipe",
+    "recipes_recipe_tags",
+    "recipes_recipeingredient",
+    "recipes_favourite",
+    "recipes_shoppingcart",
+    "recipes_shoppinglistitem",
+    "recipes_timelineentry",
+    "users_subscription",
+}
+
+
+def view_queryset(viewset, user, action, params=None):
+    """Queryset, который строит представление для запроса с params."""
+    request = APIRequestFactory().get("/", params or {})
+    force_authenticate(request, user=user)
+    view = viewset(action=action, format_kwarg=None, kwargs={})
+    view.request = Request(request, authenticators=[])
+    view.request.user = user
+    return view.filter_queryset(view.get_queryset())
+
+
+def hot_queries(user):
+    """Запросы горячих эндпоинтов, планы которых проверяются."""
+    tag = Tag.objects.first()
+    recipes = [
+        ("recipes", {}),
+        ("recipes_author", {"author": user.id}),
+        ("recipes_tags", {"tags": tag.slug if tag else ""}),
+        ("recipes_is_favorited", {"is_favorited": 1}),
+        ("recipes_is_in_shopping_cart", {"is_in_shopping_cart": 1}),
+        ("recipes_search", {"search": DISHES[0]}),
+    ]
+    for name, params in recipes:
+        yield name, view_queryset(RecipeViewSet, user, "list", params)[:6]
+    yield "recipes_feed", view_queryset(RecipeViewSet, user, "feed")[:6]
+    yield "shopping_list", get_list_ingredients(user)
+    yield "subscriptions", view_queryset(
+        UserSubscriptionsViewSet, user, "list"
+    )[:6]
+
+
+def explain(queryset):
+    """Стоимость запроса и таблицы, которые читаются целиком."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            plan = plan[0]["Plan"]
+            return plan["Total Cost"], sorted(postgresql_seq_scans(plan))
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return None, sorted(sqlite_full_scans(cursor.fetchall()))
+
+
+def postgresql_seq_scans(plan):
+    scans = set()
+    if plan["Node Type"] in ("Seq Scan", "Parallel Seq Scan"):
+        scans.add(plan["Relation Name"])
+    for child in plan.get("Plans", ()):
+        scans |= postgresql_seq_scans(child)
+    return scans
+
+
+def sqlite_full_scans(rows):
+    scans = set()
+    for row in rows:
+        detail = row[-1].split()
+        if detail[0] == "SCAN" and not {"USING", "VIRTUAL"} & set(detail):
+            scans.add(detail[1])
+    return scans
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверяет планы запросов горячих эндпоинтов: "
+        "падает на полном сканировании больших таблиц "
+        "и на росте стоимости относительно сохраненных результатов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="создать столько синтетических рецептов и откатить их"
+        )
+        parser.add_argument(
+            "--baseline", help="JSON с сохраненной стоимостью запросов"
+        )
+        parser.add_argument("--save", help="сохранить стоимость в JSON")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2,
+            help="допустимый рост стоимости, доля"
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["seed"]:
+                generate(
+                    users=max(options["seed"] // 20, 10),
+                    recipes=options["seed"],
+                    seed=options["seed"],
+                )
+            results = self.run_checks()
+            transaction.set_rollback(True)
+        if options["save"]:
+            with open(options["save"], "w") as file:
+                json.dump(
+                    {name: cost for name, (cost, _) in results.items()},
+                    file, indent=2
+                )
+        failures = self.compare(results, options)
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("Планы запросов в порядке."))
+
+    def run_checks(self):
+        user = (
+            UserFoodgram.objects.filter(favorites__isnull=False).first()
+            or UserFoodgram.objects.first()
+        )
+        if user is None:
+            raise CommandError("Нет данных, используйте --seed.")
+        results = {}
+        for name, queryset in hot_queries(user):
+            cost, scans = explain(queryset)
+            results[name] = (cost, scans)
+            self.stdout.write(
+                f"{name:30} cost={cost} full scans={', '.join(scans) or '-'}"
+            )
+        return results
+
+    def compare(self, results, options):
+        baseline = {}
+        if options["baseline"]:
+            with open(options["baseline"]) as file:
+                baseline = json.load(file)
+        failures = []
+        for name, (cost, scans) in results.items():
+            large = [table for table in scans if table in LARGE_TABLES]
+            if large:
+                failures.append(
+                    f"{name}: полное сканирование {', '.join(large)}"
+                )
+            limit = baseline.get(name)
+            if cost is not None and limit is not None and (
+                cost > limit * (1 + options["tolerance"])
+            ):
+                failures.append(
+                    f"{name}: стоимость {cost} больше сохраненной {limit}"
+                )
+        return failures
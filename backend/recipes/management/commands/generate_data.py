@@ -0,0 +1,59 @@
+from api.response_cache import RECIPES, RELATED, bump_versions
+from django.core.management.base import BaseCommand
+from recipes.generator import generate
+from recipes.indexes import ingredient_index, recipe_ingredient_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Создает синтетических пользователей, рецепты, избранное, корзины "
+        "и подписки для нагрузочного тестирования."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=10000)
+        parser.add_argument("--ingredients", type=int, default=2000)
+        parser.add_argument("--tags", type=int, default=10)
+        parser.add_argument(
+            "--favorites", type=int, default=20,
+            help="среднее число рецептов в избранном у пользователя"
+        )
+        parser.add_argument(
+            "--cart", type=int, default=5,
+            help="среднее число рецептов в корзине у пользователя"
+        )
+        parser.add_argument(
+            "--subscriptions", type=int, default=10,
+            help="среднее число подписок у пользователя"
+        )
+        parser.add_argument(
+            "--skew", type=float, default=1.1,
+            help="показатель закона Ципфа для популярности авторов, "
+                 "рецептов, тегов и ингредиентов"
+        )
+        parser.add_argument(
+            "--days", type=int, default=365,
+            help="за сколько дней распределить даты публикации"
+        )
+        parser.add_argument("--seed", type=int, help="зерно генератора")
+        parser.add_argument(
+            "--prefix", help="префикс имен создаваемых объектов"
+        )
+
+    def handle(self, *args, **options):
+        counts = generate(**{
+            name: options[name]
+            for name in (
+                "users", "recipes", "ingredients", "tags", "favorites",
+                "cart", "subscriptions", "skew", "days", "seed", "prefix",
+            )
+        })
+        # bulk_create не отправляет сигналы, закэшированные ответы
+        # и индексы сбрасываются явно.
+        bump_versions(RECIPES, RELATED)
+        ingredient_index.invalidate()
+        recipe_ingredient_index.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            ", ".join(f"{name}: {count}" for name, count in counts.items())
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+from tasks.models import Task
+from tasks.queue import enqueue
+
+
+class Command(BaseCommand):
+    help = (
+        "Ставит в очередь построение миниатюр и сжатых форматов "
+        "для картинок рецептов, у которых их нет или они устарели."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true",
+            help="перестроить варианты всех картинок"
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        queued = 0
+        for pk, image, variants in Recipe.objects.exclude(
+            image=""
+        ).values_list("id", "image", "image_variants").iterator():
+            if options["force"] or variants.get("source") != image:
+                enqueue(
+                    process_recipe_image.task_name,
+                    [pk, options["force"]],
+                    priority=Task.Priority.LOW,
+                )
+                queued += 1
+        self.stdout.write(self.style.SUCCESS(f"Поставлено задач: {queued}"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Sum
+from recipes.models import ShoppingCart, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = "Пересобирает сводные списки покупок по корзинам пользователей."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, help="id пользователя, по умолчанию все"
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        carts = ShoppingCart.objects.all()
+        items = ShoppingListItem.objects.all()
+        if options["user"]:
+            carts = carts.filter(user_id=options["user"])
+            items = items.filter(user_id=options["user"])
+        items.delete()
+        totals = (
+            carts.filter(recipe__recipeingredients__isnull=False)
+            .values("user_id")
+            .annotate(
+                ingredient_id=F("recipe__recipeingredients__ingredient_id"),
+                amount=Sum("recipe__recipeingredients__amount"),
+            )
+            .order_by()
+        )
+        created = ShoppingListItem.objects.bulk_create(
+            (ShoppingListItem(**total) for total in totals.iterator()),
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Позиций в списках покупок: {len(created)}")
+        )
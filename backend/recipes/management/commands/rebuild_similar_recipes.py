@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.similar import rebuild_similar_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает похожие рецепты для всех рецептов. Нужен после "
+        "загрузки данных в обход API и периодически, чтобы убрать "
+        "лишнее из списков, которые растут при обновлении по одному рецепту."
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        created = rebuild_similar_recipes()
+        self.stdout.write(self.style.SUCCESS(
+            f"Похожих рецептов: {created}, "
+            f"{time.perf_counter() - start:.1f} с"
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет счетчики избранного, корзин, рецептов и подписчиков "
+        "с таблицами связей и исправляет расхождения."
+    )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        for counter, fixed in reconcile_counters().items():
+            self.stdout.write(f"{counter}: исправлено {fixed}")
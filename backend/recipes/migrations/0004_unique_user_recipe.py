@@ -0,0 +1,44 @@
+# Generated by Django 3.2.18 on 2026-10-18 18:47
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+fill_shopping_lists = import_module(
+    'recipes.migrations.0003_auto_20261018_2145'
+).fill_shopping_lists
+
+
+def remove_duplicates(apps, schema_editor):
+    for model_name in ('Favourite', 'ShoppingCart'):
+        model = apps.get_model('recipes', model_name)
+        keep = (
+            model.objects.values('user', 'recipe')
+            .annotate(keep_id=Max('id'))
+            .values('keep_id')
+        )
+        removed, _ = model.objects.exclude(id__in=keep).delete()
+    # Удаленные дубликаты корзины были учтены в списках покупок.
+    if removed:
+        fill_shopping_lists(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_auto_20261018_2145'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favourite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favourite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
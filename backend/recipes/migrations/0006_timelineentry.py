@@ -0,0 +1,62 @@
+# Generated by Django 3.2.18 on 2026-10-18 18:51
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscription = apps.get_model('users', 'Subscription')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    authors = (
+        Subscription.objects.values('author')
+        .annotate(followers=Count('user'))
+        .filter(followers__lte=settings.FEED_FANOUT_LIMIT)
+        .values_list('author', flat=True)
+    )
+    for author in authors.iterator():
+        recipe_ids = list(
+            Recipe.objects.filter(author=author)
+            .order_by('-pub_date')
+            .values_list('id', flat=True)[:settings.FEED_BACKFILL_SIZE]
+        )
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+                for user_id in Subscription.objects.filter(
+                    author=author
+                ).values_list('user', flat=True)
+                for recipe_id in recipe_ids
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0005_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
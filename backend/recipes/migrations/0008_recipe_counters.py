@@ -0,0 +1,56 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Favourite = apps.get_model('recipes', 'Favourite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    Subscription = apps.get_model('users', 'Subscription')
+    UserFoodgram = apps.get_model('users', 'UserFoodgram')
+    Recipe.objects.update(
+        favorites_count=count(Favourite, 'recipe'),
+        carts_count=count(ShoppingCart, 'recipe'),
+    )
+    UserFoodgram.objects.update(
+        recipes_count=count(Recipe, 'author'),
+        followers_count=count(Subscription, 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_indexes'),
+        ('users', '0002_userfoodgram_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:47
+
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import migrations, models
+
+TAG_MASK_BITS = 63
+
+
+def fill_tags_masks(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Tag = apps.get_model('recipes', 'Tag')
+    tags = list(Tag.objects.order_by('id'))
+    if len(tags) > TAG_MASK_BITS:
+        raise ValidationError(
+            f'Тегов не может быть больше {TAG_MASK_BITS}.'
+        )
+    for bit, tag in enumerate(tags):
+        tag.bit = bit
+    Tag.objects.bulk_update(tags, ['bit'])
+    masks = defaultdict(int)
+    for recipe_id, bit in Recipe.tags.through.objects.values_list(
+        'recipe_id', 'tag__bit'
+    ):
+        masks[recipe_id] |= 1 << bit
+    Recipe.objects.bulk_update(
+        [Recipe(id=pk, tags_mask=mask) for pk, mask in masks.items()],
+        ['tags_mask'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, verbose_name='Бит в маске тегов'),
+        ),
+        migrations.RunPython(fill_tags_masks, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, unique=True, verbose_name='Бит в маске тегов'),
+        ),
+    ]
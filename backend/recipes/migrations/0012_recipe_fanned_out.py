@@ -0,0 +1,33 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+def mark_fanned_out(apps, schema_editor):
+    # Рецепты без записей в лентах остаются неразосланными
+    # и попадают в ленты при чтении.
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    Recipe.objects.filter(
+        id__in=TimelineEntry.objects.values('recipe_id')
+    ).update(fanned_out=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='fanned_out',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Разослан по лентам'),
+        ),
+        migrations.RunPython(mark_fanned_out, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['author', '-pub_date'], name='recipe_not_fanned_out_idx'),
+        ),
+    ]
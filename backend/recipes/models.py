@@ -1,6 +1,11 @@
+from collections import defaultdict
+
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import F, Q
+from users.models import CounterFieldsMixin, change_counter
 
 UserFoodgram = get_user_model()
 
@@ -28,6 +33,27 @@ class Ingredient(models.Model):
         )
 
 
+# Младшие 63 бита BigIntegerField: маска тегов не бывает отрицательной.
+TAG_MASK_BITS = 63
+
+
+def tags_mask(bits):
+    """Маска с установленными битами bits."""
+    mask = 0
+    for bit in bits:
+        mask |= 1 << bit
+    return mask
+
+
+class TagQuerySet(models.QuerySet):
+    """Набор запросов для тегов."""
+
+    def free_bits(self):
+        """Свободные биты маски тегов по возрастанию."""
+        used = set(self.model.objects.values_list("bit", flat=True))
+        return [bit for bit in range(TAG_MASK_BITS) if bit not in used]
+
+
 class Tag(models.Model):
     name = models.CharField(
         max_length=200,
@@ -51,6 +77,14 @@ class Tag(models.Model):
         unique=True,
         help_text="Укажите уникальный слаг для тэга"
     )
+    # Назначается при создании тега, см. recipes.signals.
+    bit = models.PositiveSmallIntegerField(
+        unique=True,
+        editable=False,
+        verbose_name="Бит в маске тегов"
+    )
+
+    objects = TagQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Тэг"
@@ -60,7 +94,49 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов для рецептов."""
+
+    def with_related(self):
+        """Подгружает авторов, теги и ингредиенты рецептов."""
+        return self.select_related("author").prefetch_related(
+            "tags",
+            models.Prefetch(
+                "recipeingredients",
+                queryset=RecipeIngredient.objects.select_related(
+                    "ingredient"
+                ),
+            ),
+        )
+
+    def with_any_tag(self, tags):
+        """Рецепты хотя бы с одним из тегов. Проверка маски
+        заменяет соединение с таблицей связей и DISTINCT.
+        """
+        mask = tags_mask(tag.bit for tag in tags)
+        return self.alias(
+            matched_tags=F("tags_mask").bitand(mask)
+        ).filter(matched_tags__gt=0)
+
+    def update_tags_masks(self):
+        """Пересчитывает маски тегов рецептов по таблице связей
+        и сохраняет изменившиеся. Возвращает число исправленных.
+        """
+        bits = defaultdict(list)
+        for recipe_id, bit in Recipe.tags.through.objects.filter(
+            recipe__in=self.values("id")
+        ).values_list("recipe_id", "tag__bit"):
+            bits[recipe_id].append(bit)
+        changed = []
+        for pk, mask in self.values_list("id", "tags_mask"):
+            actual = tags_mask(bits[pk])
+            if actual != mask:
+                changed.append(Recipe(id=pk, tags_mask=actual))
+        Recipe.objects.bulk_update(changed, ["tags_mask"], batch_size=1000)
+        return len(changed)
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         UserFoodgram,
         verbose_name="Автор рецепта",
@@ -83,6 +159,12 @@ class Recipe(models.Model):
         upload_to="api/images",
         verbose_name="Картинка,закодированная в Base64",
     )
+    # Миниатюра и сжатые форматы картинки, см. recipes.images.
+    image_variants = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name="Варианты картинки"
+    )
     pub_date = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата публикации'
@@ -97,11 +179,62 @@ class Recipe(models.Model):
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name="Время приготовления (в минутах)"
     )
+    # Заполняется триггером в PostgreSQL, см. recipes.search.
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False
+    )
+    # Бит Tag.bit установлен для каждого тега рецепта.
+    tags_mask = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Маска тегов"
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="В избранном"
+    )
+    carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="В списках покупок"
+    )
+    # Рецепт разослан по лентам подписчиков, см. recipes.feed.
+    fanned_out = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name="Разослан по лентам"
+    )
+
+    # Маска тегов, варианты картинки и признак рассылки, как и счетчики,
+    # меняются запросами и не перезаписываются при сохранении рецепта.
+    counter_fields = (
+        "favorites_count", "carts_count", "tags_mask", "image_variants",
+        "fanned_out",
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"],
+                name="recipe_pub_date_id_idx"
+            ),
+            models.Index(
+                fields=["author", "-pub_date"],
+                name="recipe_author_pub_date_idx"
+            ),
+            models.Index(
+                fields=["author", "-pub_date"],
+                name="recipe_not_fanned_out_idx",
+                condition=Q(fanned_out=False)
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -147,6 +280,78 @@ class RecipeIngredient(models.Model):
                 f'{self.ingredient.measurement_unit}')
 
 
+class UserRecipeManager(models.Manager):
+    """Добавление и удаление связей пользователя с рецептами
+    одним запросом, без предварительной проверки существования.
+    Вместе со связями меняет счетчик counter у рецептов.
+    """
+    counter = None
+
+    def _execute(self, sql, params):
+        connection = connections[router.db_for_write(self.model)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _change_counter(self, recipe_ids, delta):
+        change_counter(
+            Recipe.objects.filter(id__in=recipe_ids), self.counter, delta
+        )
+
+    def add(self, user_id, recipe_ids):
+        """Добавляет рецепты, возвращает id реально добавленных."""
+        if not recipe_ids:
+            return []
+        values = ", ".join(["(%s, %s)"] * len(recipe_ids))
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            added = self._execute(
+                f"INSERT INTO {self.model._meta.db_table} "
+                f"(user_id, recipe_id) VALUES {values} "
+                f"ON CONFLICT (user_id, recipe_id) DO NOTHING "
+                f"RETURNING recipe_id",
+                [value for pk in recipe_ids for value in (user_id, pk)]
+            )
+            self._change_counter(added, 1)
+        return added
+
+    def remove(self, user_id, recipe_ids):
+        """Удаляет рецепты, возвращает id реально удаленных."""
+        if not recipe_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(recipe_ids))
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            removed = self._execute(
+                f"DELETE FROM {self.model._meta.db_table} "
+                f"WHERE user_id = %s AND recipe_id IN ({placeholders}) "
+                f"RETURNING recipe_id",
+                [user_id, *recipe_ids]
+            )
+            self._change_counter(removed, -1)
+        return removed
+
+
+class FavouriteManager(UserRecipeManager):
+    """Избранное пользователя."""
+    counter = "favorites_count"
+
+
+class ShoppingCartManager(UserRecipeManager):
+    """Вместе с корзиной обновляет сводный список покупок."""
+    counter = "carts_count"
+
+    def add(self, user_id, recipe_ids):
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            added = super().add(user_id, recipe_ids)
+            ShoppingListItem.objects.add_recipes(user_id, added)
+        return added
+
+    def remove(self, user_id, recipe_ids):
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            removed = super().remove(user_id, recipe_ids)
+            ShoppingListItem.objects.remove_recipes(user_id, removed)
+        return removed
+
+
 class Favourite(models.Model):
     user = models.ForeignKey(
         UserFoodgram,
@@ -161,10 +366,18 @@ class Favourite(models.Model):
         verbose_name="Рецепт",
     )
 
+    objects = FavouriteManager()
+
     class Meta:
         ordering = ["-id"]
         verbose_name = "Избранное"
         verbose_name_plural = "Избранное"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"],
+                name="unique_favourite"
+            )
+        ]
 
     def __str__(self):
         return f"{self.user.username} добавил {self.recipe.name} в избраннное"
@@ -184,12 +397,182 @@ class ShoppingCart(models.Model):
         verbose_name="Рецепт"
     )
 
+    objects = ShoppingCartManager()
+
     class Meta:
         verbose_name = "Список покупок"
         verbose_name_plural = "Списки покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"],
+                name="unique_shopping_cart"
+            )
+        ]
 
     def __str__(self):
         return (
             f"{self.user.username} добавил"
             f"{self.recipe.name} в список покупок"
         )
+
+
+class ShoppingListItemManager(models.Manager):
+    """Поддержка сводного списка покупок в актуальном состоянии."""
+
+    def _upsert(self, select, params):
+        table = self.model._meta.db_table
+        connection = connections[router.db_for_write(self.model)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, ingredient_id, amount) "
+                f"{select} "
+                f"ON CONFLICT (user_id, ingredient_id) "
+                f"DO UPDATE SET amount = {table}.amount + excluded.amount",
+                params
+            )
+
+    def add_recipes(self, user_id, recipe_ids, sign=1):
+        """Добавляет ингредиенты рецептов в список покупок пользователя."""
+        if not recipe_ids:
+            return
+        placeholders = ", ".join(["%s"] * len(recipe_ids))
+        self._upsert(
+            f"SELECT %s, ingredient_id, SUM(amount) * %s "
+            f"FROM {RecipeIngredient._meta.db_table} "
+            f"WHERE recipe_id IN ({placeholders}) GROUP BY ingredient_id",
+            [user_id, sign, *recipe_ids]
+        )
+        if sign < 0:
+            self.filter(user_id=user_id, amount__lte=0).delete()
+
+    def remove_recipes(self, user_id, recipe_ids):
+        """Убирает ингредиенты рецептов из списка покупок пользователя."""
+        self.add_recipes(user_id, recipe_ids, sign=-1)
+
+    def apply_recipe_deltas(self, recipe_id, deltas):
+        """Применяет изменения количества ингредиентов рецепта
+        {id ингредиента: разница} ко всем спискам покупок с этим рецептом.
+        """
+        deltas = {key: value for key, value in deltas.items() if value}
+        if not deltas:
+            return
+        values = ", ".join(["(%s, %s)"] * len(deltas))
+        params = [value for delta in deltas.items() for value in delta]
+        self._upsert(
+            f"SELECT cart.user_id, delta.column1, delta.column2 "
+            f"FROM {ShoppingCart._meta.db_table} AS cart, "
+            f"(VALUES {values}) AS delta WHERE cart.recipe_id = %s",
+            params + [recipe_id]
+        )
+        if min(deltas.values()) < 0:
+            self.filter(
+                user__carts__recipe_id=recipe_id, amount__lte=0
+            ).delete()
+
+
+class ShoppingListItem(models.Model):
+    """Сводный список покупок пользователя.
+    Обновляется при изменении корзины и ингредиентов рецептов в ней.
+    """
+    user = models.ForeignKey(
+        UserFoodgram,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь"
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_items",
+        verbose_name="Ингредиент"
+    )
+    amount = models.IntegerField(
+        verbose_name="Количество"
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = "Позиция списка покупок"
+        verbose_name_plural = "Позиции списка покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_shopping_list_item"
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.user.username}: {self.ingredient.name} - "
+            f"{self.amount} {self.ingredient.measurement_unit}"
+        )
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя.
+    Записи создаются при публикации рецепта, см. recipes.feed.
+    """
+    user = models.ForeignKey(
+        UserFoodgram,
+        on_delete=models.CASCADE,
+        related_name="timeline",
+        verbose_name="Пользователь"
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        verbose_name="Рецепт"
+    )
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи ленты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"],
+                name="unique_timeline_entry"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.recipe.name} в ленте {self.user.username}"
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт по ингредиентам и тегам.
+    Списки строятся заранее, см. recipes.similar.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similar_recipes",
+        verbose_name="Рецепт"
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similar_to",
+        verbose_name="Похожий рецепт"
+    )
+    score = models.FloatField(verbose_name="Сходство")
+
+    class Meta:
+        verbose_name = "Похожий рецепт"
+        verbose_name_plural = "Похожие рецепты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipe", "similar"],
+                name="unique_similar_recipe"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["recipe", "-score"],
+                name="similar_recipe_score_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.similar.name} похож на {self.recipe.name}"
@@ -0,0 +1,149 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections, router
+from django.db.models import F, Q
+
+SEARCH_CONFIGS = ("russian", "english")
+FTS_TABLE = "recipes_recipe_fts"
+
+POSTGRESQL_SETUP = """
+CREATE FUNCTION recipes_recipe_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(NEW.text, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update();
+UPDATE recipes_recipe SET name = name;
+CREATE INDEX recipes_recipe_search_vector_idx
+    ON recipes_recipe USING GIN (search_vector);
+"""
+
+POSTGRESQL_TEARDOWN = """
+DROP INDEX IF EXISTS recipes_recipe_search_vector_idx;
+DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger ON recipes_recipe;
+DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update();
+"""
+
+SQLITE_SETUP = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"name, text, tokenize='unicode61 remove_diacritics 2')",
+    f"INSERT INTO {FTS_TABLE} (rowid, name, text) "
+    f"SELECT id, name, text FROM recipes_recipe",
+)
+
+SQLITE_TEARDOWN = (f"DROP TABLE IF EXISTS {FTS_TABLE}",)
+
+
+def create_search_index(schema_editor):
+    """Создает полнотекстовый индекс рецептов.
+    PostgreSQL: tsvector-колонка с GIN-индексом, заполняется триггером.
+    SQLite: отдельная таблица FTS5, заполняется из index_recipe().
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(POSTGRESQL_SETUP)
+    elif vendor == "sqlite":
+        for sql in SQLITE_SETUP:
+            schema_editor.execute(sql)
+
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(POSTGRESQL_TEARDOWN)
+    elif vendor == "sqlite":
+        for sql in SQLITE_TEARDOWN:
+            schema_editor.execute(sql)
+
+
+def _sqlite_connection(model):
+    connection = connections[router.db_for_write(model)]
+    return connection if connection.vendor == "sqlite" else None
+
+
+def index_recipe(recipe):
+    """Обновляет рецепт в таблице FTS5.
+    В PostgreSQL индекс поддерживается триггером.
+    """
+    connection = _sqlite_connection(type(recipe))
+    if connection is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [recipe.pk]
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, text) VALUES (%s, %s, %s)",
+            [recipe.pk, recipe.name, recipe.text]
+        )
+
+
+def index_recipes(recipes):
+    """Добавляет в таблицу FTS5 рецепты, созданные через bulk_create."""
+    recipes = list(recipes)
+    if not recipes:
+        return
+    connection = _sqlite_connection(type(recipes[0]))
+    if connection is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, text) VALUES (%s, %s, %s)",
+            [(recipe.pk, recipe.name, recipe.text) for recipe in recipes]
+        )
+
+
+def unindex_recipe(recipe):
+    connection = _sqlite_connection(type(recipe))
+    if connection is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [recipe.pk]
+        )
+
+
+def search_recipes(queryset, query):
+    """Фильтрует рецепты по поисковому запросу
+    и сортирует их по релевантности.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIGS[0], search_type="websearch"
+        )
+        for config in SEARCH_CONFIGS[1:]:
+            search_query |= SearchQuery(
+                query, config=config, search_type="websearch"
+            )
+        return queryset.annotate(
+            rank=SearchRank(F("search_vector"), search_query)
+        ).filter(search_vector=search_query).order_by("-rank", "-pub_date")
+    if vendor == "sqlite":
+        # Таблица FTS5 присоединяется к рецептам: MATCH выполняется
+        # один раз, а rank берется из найденных строк.
+        match = " ".join(f'"{word}"*' for word in words)
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[
+                f"{FTS_TABLE} MATCH %s",
+                f"{FTS_TABLE}.rowid = recipes_recipe.id",
+            ],
+            params=[match],
+            select={"rank": f"{FTS_TABLE}.rank"},
+        ).order_by("rank", "-pub_date")
+    condition = Q()
+    for word in words:
+        condition &= Q(name__icontains=word) | Q(text__icontains=word)
+    return queryset.filter(condition)
@@ -0,0 +1,150 @@
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from recipes.indexes import ingredient_index, recipe_ingredient_index
+from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.search import index_recipe, unindex_recipe
+from users.models import Subscription, UserFoodgram, change_counter
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+# Ингредиенты рецептов из API сохраняются bulk_create без сигналов,
+# но вместе с самим рецептом: журнал применяется после фиксации
+# и перечитывает рецепт целиком.
+@receiver([post_save, post_delete], sender=Recipe)
+def journal_recipe(sender, instance, **kwargs):
+    recipe_ingredient_index.changed([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def journal_recipe_ingredient(sender, instance, **kwargs):
+    recipe_ingredient_index.changed([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def journal_recipe_tags(sender, instance, action, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if isinstance(instance, Recipe):
+        recipe_ingredient_index.changed([instance.pk])
+    elif pk_set:
+        recipe_ingredient_index.changed(pk_set)
+
+
+@receiver(pre_save, sender=Tag)
+def assign_tag_bit(sender, instance, **kwargs):
+    if instance.bit is not None:
+        return
+    free = Tag.objects.free_bits()
+    if not free:
+        raise ValidationError("Свободных битов в маске тегов не осталось.")
+    instance.bit = free[0]
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_recipe_tags_mask(sender, instance, action, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if isinstance(instance, Recipe):
+        recipes = Recipe.objects.filter(pk=instance.pk)
+    elif action == "post_clear":
+        recipes = Recipe.objects.with_any_tag([instance])
+    else:
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+    recipes.update_tags_masks()
+
+
+# Связи удаленного тега удаляются каскадом без m2m_changed.
+@receiver(post_delete, sender=Tag)
+def clear_tag_bit(sender, instance, **kwargs):
+    Recipe.objects.with_any_tag([instance]).update(
+        tags_mask=F("tags_mask").bitand(~(1 << instance.bit))
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.add_recipes(
+            instance.user_id, [instance.recipe_id]
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_recipe_from_shopping_list(sender, instance, **kwargs):
+    ShoppingListItem.objects.remove_recipes(
+        instance.user_id, [instance.recipe_id]
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def add_recipe_to_search_index(sender, instance, **kwargs):
+    index_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_search_index(sender, instance, **kwargs):
+    unindex_recipe(instance)
+
+
+# Менеджеры Favourite и ShoppingCart меняют счетчики сами,
+# сигналы нужны для сохранения и удаления через ORM,
+# в том числе каскадного.
+@receiver(post_save, sender=Favourite)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            sender.objects.counter, 1
+        )
+
+
+@receiver(post_delete, sender=Favourite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id),
+        sender.objects.counter, -1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            UserFoodgram.objects.filter(pk=instance.author_id),
+            "recipes_count", 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    change_counter(
+        UserFoodgram.objects.filter(pk=instance.author_id),
+        "recipes_count", -1
+    )
+
+
+@receiver(post_save, sender=Subscription)
+def increment_followers_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            UserFoodgram.objects.filter(pk=instance.author_id),
+            "followers_count", 1
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def decrement_followers_count(sender, instance, **kwargs):
+    change_counter(
+        UserFoodgram.objects.filter(pk=instance.author_id),
+        "followers_count", -1
+    )
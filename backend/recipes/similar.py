@@ -0,0 +1,199 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from recipes.models import Recipe, RecipeIngredient, SimilarRecipe
+from scipy import sparse
+from tasks.models import Task
+from tasks.queue import task
+
+# Сколько ячеек плотной матрицы сходства считается за один шаг.
+CHUNK_CELLS = 2_000_000
+BATCH_SIZE = 1000
+
+RecipeTag = Recipe.tags.through
+
+
+def combine(ingredients, tags):
+    """Косинусное сходство по ингредиентам, усиленное сходством по тегам.
+    Рецепты без общих ингредиентов не похожи независимо от тегов.
+    """
+    return ingredients * (1 + settings.SIMILAR_RECIPES_TAG_WEIGHT * tags)
+
+
+def incidence(recipe_ids, pairs):
+    """Разреженная матрица рецепт x признак из пар (id рецепта, id признака)
+    со строками единичной длины. Пары рецептов не из recipe_ids
+    (созданных после чтения списка) пропускаются.
+    """
+    pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+    rows = np.searchsorted(recipe_ids, pairs[:, 0])
+    known = rows < len(recipe_ids)
+    known[known] = recipe_ids[rows[known]] == pairs[known, 0]
+    rows, pairs = rows[known], pairs[known]
+    columns, column_index = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, column_index)),
+        shape=(len(recipe_ids), len(columns)),
+    )
+    norms = np.sqrt(matrix.getnnz(axis=1)).astype(np.float32)
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def top_scores(scores, count):
+    """Номера строк, столбцов и значения count наибольших
+    положительных значений в каждой строке.
+    """
+    count = min(count, scores.shape[1])
+    top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+    values = np.take_along_axis(scores, top, axis=1)
+    rows, positions = np.nonzero(values > 0)
+    return rows, top[rows, positions], values[rows, positions]
+
+
+@transaction.atomic
+def rebuild_similar_recipes():
+    """Пересчитывает все списки похожих рецептов.
+    Сходство считается произведением матриц рецепт x ингредиент
+    и рецепт x тег по частям, чтобы не держать в памяти матрицу n x n.
+    """
+    recipe_ids = np.array(
+        Recipe.objects.order_by("id").values_list("id", flat=True),
+        dtype=np.int64,
+    )
+    ingredients = incidence(
+        recipe_ids,
+        RecipeIngredient.objects.values_list(
+            "recipe_id", "ingredient_id"
+        ).iterator(),
+    )
+    tags = incidence(
+        recipe_ids,
+        RecipeTag.objects.values_list("recipe_id", "tag_id").iterator(),
+    ).toarray()
+    SimilarRecipe.objects.all().delete()
+    size = len(recipe_ids)
+    if size < 2:
+        return 0
+    ingredients_t = ingredients.T.tocsr()
+    ids = recipe_ids.tolist()
+    chunk = max(1, CHUNK_CELLS // size)
+    created = 0
+    for start in range(0, size, chunk):
+        stop = min(start + chunk, size)
+        scores = combine(
+            (ingredients[start:stop] @ ingredients_t).toarray(),
+            tags[start:stop] @ tags.T,
+        )
+        scores[np.arange(stop - start), np.arange(start, stop)] = 0
+        rows, columns, values = top_scores(
+            scores, settings.SIMILAR_RECIPES_COUNT
+        )
+        created += len(SimilarRecipe.objects.bulk_create(
+            (
+                SimilarRecipe(
+                    recipe_id=ids[start + row],
+                    similar_id=ids[column],
+                    score=score,
+                )
+                for row, column, score in zip(
+                    rows.tolist(), columns.tolist(), values.tolist()
+                )
+            ),
+            batch_size=BATCH_SIZE,
+        ))
+    return created
+
+
+def overlaps(through, field, candidates, values):
+    """Для рецептов-кандидатов: id рецепта, число общих признаков
+    из values и число всех признаков рецепта.
+    """
+    rows = (
+        through.objects.filter(recipe_id__in=candidates)
+        .values("recipe_id")
+        .annotate(
+            shared=Count("pk", filter=Q(**{f"{field}__in": values})),
+            size=Count("pk"),
+        )
+        .order_by("recipe_id")
+        .values_list("recipe_id", "shared", "size")
+    )
+    return np.array(list(rows), dtype=np.int64).reshape(-1, 3)
+
+
+def align(ids, rows):
+    """Столбцы rows без первого, расставленные по позициям id из первого
+    столбца в ids. Оба массива упорядочены по id, ids без строки - нули.
+    """
+    result = np.zeros((len(ids), rows.shape[1] - 1))
+    result[np.searchsorted(ids, rows[:, 0])] = rows[:, 1:]
+    return result
+
+
+@task(priority=Task.Priority.LOW)
+@transaction.atomic
+def refresh_similar_recipes(recipe_id):
+    """Пересчитывает похожие рецепты для одного рецепта
+    и добавляет его в списки рецептов, которым он теперь похож.
+    Общие признаки считаются в базе, сходство - так же,
+    как в rebuild_similar_recipes(). Списки других рецептов
+    могут стать длиннее SIMILAR_RECIPES_COUNT до полной перестройки.
+    """
+    count = settings.SIMILAR_RECIPES_COUNT
+    SimilarRecipe.objects.filter(
+        Q(recipe_id=recipe_id) | Q(similar_id=recipe_id)
+    ).delete()
+    ingredient_ids = list(
+        RecipeIngredient.objects.filter(recipe_id=recipe_id)
+        .values_list("ingredient_id", flat=True)
+    )
+    tag_ids = list(
+        RecipeTag.objects.filter(recipe_id=recipe_id)
+        .values_list("tag_id", flat=True)
+    )
+    candidates = RecipeIngredient.objects.filter(
+        ingredient_id__in=ingredient_ids
+    ).exclude(recipe_id=recipe_id).values("recipe_id")
+    ingredients = overlaps(
+        RecipeIngredient, "ingredient_id", candidates, ingredient_ids
+    )
+    if not len(ingredients):
+        return
+    ids = ingredients[:, 0]
+    tags = align(ids, overlaps(RecipeTag, "tag_id", candidates, tag_ids))
+    scores = combine(
+        ingredients[:, 1] / np.sqrt(ingredients[:, 2] * len(ingredient_ids)),
+        tags[:, 0] / np.sqrt(np.maximum(tags[:, 1] * len(tag_ids), 1)),
+    )
+    # Самое низкое сходство и длина текущих списков кандидатов.
+    lists = align(ids, np.array(
+        list(
+            SimilarRecipe.objects.filter(recipe_id__in=candidates)
+            .values("recipe_id")
+            .annotate(lowest=Min("score"), size=Count("pk"))
+            .order_by("recipe_id")
+            .values_list("recipe_id", "lowest", "size")
+        ),
+        dtype=np.float64,
+    ).reshape(-1, 3))
+    joins = (lists[:, 1] < count) | (scores > lists[:, 0])
+    ids, scores = ids.tolist(), scores.tolist()
+    SimilarRecipe.objects.bulk_create(
+        [
+            SimilarRecipe(
+                recipe_id=recipe_id, similar_id=ids[index],
+                score=scores[index]
+            )
+            for index in np.argsort(scores, kind="stable")[::-1][:count]
+        ]
+        + [
+            SimilarRecipe(
+                recipe_id=ids[index], similar_id=recipe_id,
+                score=scores[index]
+            )
+            for index in np.nonzero(joins)[0].tolist()
+        ],
+        batch_size=BATCH_SIZE,
+    )
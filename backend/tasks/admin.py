@@ -0,0 +1,11 @@
+from django.contrib import admin
+from tasks.models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = (
+        "id", "name", "status", "priority", "attempts", "run_at", "duration"
+    )
+    list_filter = ("status", "name")
+    readonly_fields = [field.name for field in Task._meta.fields]
@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import (ALL_COMPLETED, FIRST_COMPLETED,
+                                ProcessPoolExecutor, wait)
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from tasks.models import Task
+from tasks.queue import claim, execute, finish, heartbeat, purge, requeue_stale
+
+# Как часто возвращать зависшие задачи в очередь и чистить выполненные.
+MAINTENANCE_INTERVAL = 60
+# Как часто обновлять отметку выполняющихся задач, должно быть
+# заметно меньше TASKS_LOCK_TIMEOUT.
+HEARTBEAT_INTERVAL = 30
+
+
+def ignore_stop_signals():
+    # Сигнал может получить вся группа процессов, а останавливает пул
+    # родитель, дождавшись выполняющихся задач.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def start_pool(processes):
+    """Пул процессов-исполнителей. Процессы создаются форком сразу,
+    пока у родителя нет открытых соединений с базой: общий сокет
+    соединения нельзя использовать из нескольких процессов.
+    """
+    connections.close_all()
+    pool = ProcessPoolExecutor(
+        processes,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=ignore_stop_signals,
+    )
+    pool.submit(time.sleep, 0).result()
+    return pool
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет фоновые задачи из очереди в базе данных "
+        "в пуле процессов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=os.cpu_count(),
+            help="число процессов-исполнителей"
+        )
+        parser.add_argument(
+            "--poll", type=float, default=1.0,
+            help="пауза между проверками пустой очереди, с"
+        )
+        parser.add_argument(
+            "--burst", action="store_true",
+            help="завершиться, когда готовых задач не останется"
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.processes = options["processes"]
+        self.pool = start_pool(self.processes)
+        self.running = {}
+        self.maintained_at = 0
+        self.heartbeat_at = time.monotonic()
+        self.stdout.write(
+            f"Воркер {self.name}: {self.processes} процессов, "
+            f"TASKS_EAGER={settings.TASKS_EAGER}"
+        )
+        try:
+            while not self.stopping:
+                self.heartbeat()
+                self.maintain()
+                claimed = self.submit()
+                if options["burst"] and not claimed and not self.running:
+                    break
+                self.collect(options["poll"])
+        finally:
+            self.collect(None, every=True)
+            self.pool.shutdown()
+
+    def stop(self, signum, frame):
+        self.stdout.write("Остановка после выполняющихся задач.")
+        self.stopping = True
+
+    def heartbeat(self):
+        if time.monotonic() - self.heartbeat_at < HEARTBEAT_INTERVAL:
+            return
+        self.heartbeat_at = time.monotonic()
+        if self.running:
+            heartbeat(self.name, list(self.running.values()))
+
+    def maintain(self):
+        if time.monotonic() - self.maintained_at < MAINTENANCE_INTERVAL:
+            return
+        self.maintained_at = time.monotonic()
+        requeued, purged = requeue_stale(), purge()
+        if requeued or purged:
+            self.stdout.write(
+                f"Возвращено в очередь: {requeued}, удалено: {purged}"
+            )
+
+    def submit(self):
+        free = self.processes - len(self.running)
+        ids = claim(self.name, free) if free > 0 else []
+        for pk in ids:
+            self.running[self.pool.submit(execute, pk)] = pk
+        return ids
+
+    def collect(self, timeout, every=False):
+        """Ждет завершения задач и разбирает результаты."""
+        if not self.running:
+            if timeout:
+                time.sleep(timeout)
+            return
+        done, _ = wait(
+            self.running,
+            timeout=timeout,
+            return_when=ALL_COMPLETED if every else FIRST_COMPLETED,
+        )
+        broken = False
+        for future in done:
+            pk = self.running.pop(future)
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool):
+                broken = True
+                self.lost(pk)
+            elif error is not None:
+                self.stderr.write(f"Задача {pk}: {error!r}")
+        if broken and not self.stopping:
+            self.pool.shutdown()
+            self.pool = start_pool(self.processes)
+
+    def lost(self, pk):
+        """Задача, процесс которой завершился аварийно."""
+        task = Task.objects.filter(pk=pk).first()
+        if task is not None:
+            finish(task, None, "Процесс воркера завершился аварийно.")
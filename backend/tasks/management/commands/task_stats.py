@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from tasks.models import Task
+from tasks.queue import stats
+
+
+def milliseconds(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.1f}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Метрики очереди фоновых задач: состояния, повторы, "
+        "длительность выполнения и ожидание в очереди."
+    )
+
+    def handle(self, *args, **options):
+        statuses = Task.Status.values
+        self.stdout.write(
+            f"{'задача':50} " + " ".join(f"{name:>8}" for name in statuses)
+            + f" {'retried':>8} {'avg, мс':>9} {'max, мс':>9} {'lag, с':>8}"
+        )
+        for row in stats():
+            self.stdout.write(
+                f"{row['name'][-50:]:50} "
+                + " ".join(f"{row[name]:8}" for name in statuses)
+                + f" {row['retried']:8}"
+                f" {milliseconds(row['avg_duration']):>9}"
+                f" {milliseconds(row['max_duration']):>9}"
+                f" {row['lag']:8.1f}"
+            )
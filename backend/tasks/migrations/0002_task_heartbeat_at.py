@@ -0,0 +1,25 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:30
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_heartbeats(apps, schema_editor):
+    Task = apps.get_model('tasks', 'Task')
+    Task.objects.filter(status='running').update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Отметка воркера'),
+        ),
+        migrations.RunPython(fill_heartbeats, migrations.RunPython.noop),
+    ]
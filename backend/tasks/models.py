@@ -0,0 +1,97 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """Фоновая задача: вызов зарегистрированной функции с аргументами.
+    Задачи выполняет manage.py run_worker, см. tasks.queue.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "В очереди"
+        RUNNING = "running", "Выполняется"
+        DONE = "done", "Выполнена"
+        FAILED = "failed", "Ошибка"
+
+    class Priority(models.IntegerChoices):
+        LOW = 0, "Низкий"
+        NORMAL = 10, "Обычный"
+        HIGH = 20, "Высокий"
+
+    name = models.CharField(
+        max_length=200,
+        verbose_name="Функция"
+    )
+    args = models.JSONField(
+        default=list,
+        verbose_name="Аргументы"
+    )
+    priority = models.SmallIntegerField(
+        choices=Priority.choices,
+        default=Priority.NORMAL,
+        verbose_name="Приоритет"
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.QUEUED,
+        verbose_name="Состояние"
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Попыток"
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name="Максимум попыток"
+    )
+    run_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Выполнить после"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Создана"
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Начата"
+    )
+    # Воркер обновляет отметку, пока задача выполняется.
+    heartbeat_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Отметка воркера"
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Завершена"
+    )
+    duration = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="Длительность, с"
+    )
+    worker = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name="Воркер"
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name="Ошибка"
+    )
+
+    class Meta:
+        verbose_name = "Задача"
+        verbose_name_plural = "Задачи"
+        indexes = [
+            models.Index(
+                fields=["status", "-priority", "run_at"],
+                name="task_queue_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name}{tuple(self.args)} - {self.status}"
@@ -0,0 +1,215 @@
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import Avg, Count, F, Max, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from tasks.models import Task
+
+logger = logging.getLogger("tasks")
+
+# Зарегистрированные задачи по полному имени функции.
+REGISTRY = {}
+
+
+def task(priority=Task.Priority.NORMAL, max_attempts=None):
+    """Регистрирует функцию как фоновую задачу и добавляет ей
+    метод delay(*args), который ставит вызов в очередь, и task_name -
+    имя для enqueue(). Аргументы должны сериализоваться в JSON.
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        REGISTRY[name] = func
+
+        def delay(*args):
+            return enqueue(name, args, priority, max_attempts)
+
+        func.delay = delay
+        func.task_name = name
+        return func
+    return decorator
+
+
+def enqueue(name, args=(), priority=Task.Priority.NORMAL, max_attempts=None):
+    """Ставит задачу в очередь в текущей транзакции: воркер увидит ее
+    только после фиксации, вместе с данными, которые она обрабатывает.
+    При TASKS_EAGER функция выполняется в этом процессе после фиксации.
+    """
+    using = router.db_for_write(Task)
+    if settings.TASKS_EAGER:
+        transaction.on_commit(lambda: run_eager(name, args), using=using)
+        return None
+    return Task.objects.using(using).create(
+        name=name,
+        args=list(args),
+        priority=priority,
+        max_attempts=max_attempts or settings.TASKS_MAX_ATTEMPTS,
+    )
+
+
+def run_eager(name, args):
+    """Выполняет задачу в процессе, который ее поставил.
+    Данные запроса уже зафиксированы, поэтому ошибка задачи
+    только пишется в журнал и не превращает запрос в 500.
+    """
+    try:
+        REGISTRY[name](*args)
+    except Exception:
+        logger.exception("Задача %s%s упала", name, tuple(args))
+
+
+def claim(worker, limit):
+    """Забирает до limit готовых задач по убыванию приоритета
+    и возвращает их id. На PostgreSQL воркеры пропускают строки,
+    заблокированные другими (SKIP LOCKED), на остальных базах задача
+    достается тому, чье условное обновление изменило строку.
+    """
+    using = router.db_for_write(Task)
+    tasks = Task.objects.using(using)
+    now = timezone.now()
+    ready = tasks.filter(
+        status=Task.Status.QUEUED, run_at__lte=now
+    ).order_by("-priority", "run_at", "id")
+    running = {
+        "status": Task.Status.RUNNING,
+        "worker": worker,
+        "started_at": now,
+        "heartbeat_at": now,
+        "attempts": F("attempts") + 1,
+    }
+    if connections[using].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=using):
+            ids = list(
+                ready.select_for_update(skip_locked=True)
+                .values_list("id", flat=True)[:limit]
+            )
+            tasks.filter(id__in=ids).update(**running)
+        return ids
+    return [
+        pk for pk in ready.values_list("id", flat=True)[:limit]
+        if tasks.filter(pk=pk, status=Task.Status.QUEUED).update(**running)
+    ]
+
+
+def execute(task_id):
+    """Выполняет задачу, обычно в процессе пула воркера.
+    Возвращает новое состояние задачи.
+    """
+    close_old_connections()
+    try:
+        task = Task.objects.get(pk=task_id)
+        start = time.perf_counter()
+        try:
+            load(task.name)(*task.args)
+        except Exception:
+            return finish(
+                task, time.perf_counter() - start, traceback.format_exc()
+            )
+        return finish(task, time.perf_counter() - start)
+    finally:
+        close_old_connections()
+
+
+def load(name):
+    func = import_string(name)
+    if REGISTRY.get(name) is not func:
+        raise ImportError(f"{name} не зарегистрирована как задача.")
+    return func
+
+
+def finish(task, duration, error=""):
+    """Сохраняет результат попытки. Упавшая задача возвращается
+    в очередь с удваивающейся задержкой, пока не кончатся попытки.
+    Если задачу уже забрал другой воркер, результат не сохраняется.
+    """
+    now = timezone.now()
+    status = Task.Status.DONE
+    run_at = task.run_at
+    if error and task.attempts < task.max_attempts:
+        status = Task.Status.QUEUED
+        run_at = now + timedelta(
+            seconds=settings.TASKS_RETRY_DELAY * 2 ** (task.attempts - 1)
+        )
+    elif error:
+        status = Task.Status.FAILED
+    Task.objects.filter(
+        pk=task.pk, status=Task.Status.RUNNING, attempts=task.attempts
+    ).update(
+        status=status,
+        run_at=run_at,
+        finished_at=now,
+        duration=duration,
+        error=error,
+    )
+    if error:
+        logger.warning(
+            "Задача %s %s, попытка %s: %s",
+            task.pk, task.name, task.attempts, error
+        )
+    else:
+        logger.info(
+            "Задача %s %s выполнена за %.3f с", task.pk, task.name, duration
+        )
+    return status
+
+
+def heartbeat(worker, ids):
+    """Отмечает, что воркер жив и выполняет задачи ids."""
+    return Task.objects.filter(
+        id__in=ids, status=Task.Status.RUNNING, worker=worker
+    ).update(heartbeat_at=timezone.now())
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи воркеров, которые не обновляли
+    отметку TASKS_LOCK_TIMEOUT секунд, или отмечает их упавшими.
+    """
+    stale = Task.objects.filter(
+        status=Task.Status.RUNNING,
+        heartbeat_at__lt=timezone.now() - timedelta(
+            seconds=settings.TASKS_LOCK_TIMEOUT
+        ),
+    )
+    error = "Воркер перестал отвечать."
+    stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Task.Status.FAILED, error=error
+    )
+    return stale.update(status=Task.Status.QUEUED, error=error)
+
+
+def purge():
+    """Удаляет выполненные задачи старше TASKS_KEEP_DONE_HOURS."""
+    return Task.objects.filter(
+        status=Task.Status.DONE,
+        finished_at__lt=timezone.now() - timedelta(
+            hours=settings.TASKS_KEEP_DONE_HOURS
+        ),
+    ).delete()[0]
+
+
+def stats():
+    """Метрики очереди по задачам: число задач в каждом состоянии,
+    повторные попытки, длительность выполненных и ожидание
+    самой старой готовой задачи в секундах.
+    """
+    now = timezone.now()
+    rows = Task.objects.values("name").order_by("name").annotate(
+        **{
+            status: Count("id", filter=Q(status=status))
+            for status in Task.Status.values
+        },
+        retried=Count("id", filter=Q(attempts__gt=1)),
+        avg_duration=Avg("duration", filter=Q(status=Task.Status.DONE)),
+        max_duration=Max("duration", filter=Q(status=Task.Status.DONE)),
+        oldest=Min(
+            "run_at", filter=Q(status=Task.Status.QUEUED, run_at__lte=now)
+        ),
+    )
+    for row in rows:
+        oldest = row.pop("oldest")
+        row["lag"] = (now - oldest).total_seconds() if oldest else 0
+        yield row
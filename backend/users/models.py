@@ -1,9 +1,53 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import F
 
 
-class UserFoodgram(AbstractUser):
+def change_counter(queryset, counter, delta):
+    """Атомарно меняет счетчик, не опуская его ниже нуля."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{counter}__gte': -delta})
+    return queryset.update(**{counter: F(counter) + delta})
+
+
+class CounterFieldsMixin:
+    """Не перезаписывает счетчики при сохранении объекта.
+    Счетчики меняются только запросами с F(), поэтому значения,
+    прочитанные до сохранения, могли устареть.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and not args
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class UserFoodgram(CounterFieldsMixin, AbstractUser):
     email = models.EmailField(max_length=254, blank=False)
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков'
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
 
 class Subscription(models.Model):